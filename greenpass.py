@@ -16,22 +16,28 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from greenpass.api import CertificateUpdater
-from greenpass.api import ForcedCertificateUpdater
-from greenpass.api import CachedCertificateUpdater
-from greenpass.input import InputTransformer
-from greenpass.output import OutputManager, NoneOutput
-from greenpass.logic import GreenPassParser, LogicManager
-from greenpass.settings import SettingsManager
-
-import os
-import sys
-import shutil
-import locale
-import argparse
-import platform
-import colorama
-import functools
+# Time spent loading the modules, reported by --profile
+import time
+IMPORTS_STARTED = time.perf_counter()
+
+from greenpass.api import get_certificate_updater  # noqa: E402
+from greenpass.input import InputTransformer  # noqa: E402
+from greenpass.output import OutputManager, NoneOutput  # noqa: E402
+from greenpass.output import RECORD_OUTPUTS, get_record_output  # noqa: E402
+from greenpass.logic import GreenPassParser, LogicManager  # noqa: E402
+from greenpass.settings import SettingsManager, DEFAULT_MAX_AGE  # noqa: E402
+from greenpass.data import get_value_sets  # noqa: E402
+from greenpass import metrics  # noqa: E402
+
+import os  # noqa: E402
+import sys  # noqa: E402
+import shutil  # noqa: E402
+import locale  # noqa: E402
+import argparse  # noqa: E402
+import platform  # noqa: E402
+import functools  # noqa: E402
+
+IMPORTS_DONE = time.perf_counter()
 
 # Cache Directory
 DEFAULT_CACHE_DIR = functools.reduce(
@@ -58,6 +64,11 @@ def setup_argparse():
     command.add_argument("--txt",
                          help="read qrcode content from file")
 
+    command.add_argument("--serve",
+                         metavar="ADDRESS",
+                         help="Run a verification daemon listening on "
+                              "HOST:PORT or unix:PATH")
+
     # Optional Parameters
     parser.add_argument("--cachedir",
                         default=DEFAULT_CACHE_DIR,
@@ -84,6 +95,12 @@ def setup_argparse():
                         action="store_true",
                         help="Remove the cache directory")
 
+    parser.add_argument("--max-age",
+                        type=int,
+                        default=DEFAULT_MAX_AGE,
+                        help="Revalidate cached data older than MAX_AGE "
+                             "seconds, default:{}".format(DEFAULT_MAX_AGE))
+
     parser.add_argument("--key",
                         help="Public certificate to verify the greenpass with")
 
@@ -99,6 +116,10 @@ def setup_argparse():
                         action="store_true",
                         help="Do not consider block list")
 
+    parser.add_argument("--drl",
+                        action="store_true",
+                        help="Synchronize and check the revocation list")
+
     parser.add_argument("--at-date",
                         help="Use AT_DATE instead of the current date")
 
@@ -110,9 +131,43 @@ def setup_argparse():
                         action="store_true",
                         help="Do not print anything")
 
+    parser.add_argument("--stream",
+                        action="store_true",
+                        help="Verify one qrcode content per line of the "
+                             "--txt input, print one JSON verdict per line")
+
+    parser.add_argument("--format",
+                        choices=("text",) + tuple(sorted(RECORD_OUTPUTS)),
+                        default="text",
+                        help="Output format of the verdicts, --stream "
+                             "uses ndjson for text, default:text")
+
+    parser.add_argument("--fast-verify",
+                        action="store_true",
+                        help="Verify the ES256 and PS256 signatures "
+                             "directly with cryptography")
+
+    parser.add_argument("--cache-results",
+                        type=int,
+                        metavar="SECONDS",
+                        help="With --stream and --serve, keep the "
+                             "certificates already verified for SECONDS, "
+                             "a qrcode scanned again is only checked "
+                             "against the current date and blocklist")
+
     parser.add_argument("--language",
                         help="Select the language, use two letter code")
 
+    parser.add_argument("--profile",
+                        metavar="FILE",
+                        help="Write a trace of the verification stages to "
+                             "FILE, in Chrome trace event format")
+
+    parser.add_argument("--cprofile",
+                        metavar="FILE",
+                        help="Write a cProfile report, sorted by "
+                             "cumulative time, to FILE")
+
     return parser.parse_args()
 
 
@@ -127,6 +182,7 @@ def manage_cache(cachedir, no_cache, clear_cache):
 
 
 def _setup_colors():
+    import colorama
     colorama.init()
     from termcolor import colored
     return colored
@@ -178,15 +234,93 @@ def get_language(lang):
     return lang.split("_")[0]
 
 
+def run_stream(args, sm, cachedir, path):
+    from greenpass.stream import StreamVerifier
+    from greenpass.refresh import start_refresher
+
+    cup = get_certificate_updater(cachedir, args.key, args.max_age)
+    logic = LogicManager(cachedir, args.fast_verify,
+                         result_cache_ttl=args.cache_results)
+    fmt = "ndjson" if args.format == "text" else args.format
+    sv = StreamVerifier(sm, logic, cup,
+                        enable_blocklist=not args.no_block_list,
+                        record_output=get_record_output(fmt))
+
+    # Keep settings and keys fresh while the stream is running
+    refresher = start_refresher(args.max_age, sm, cup.trust_store)
+    try:
+        if path == "-":
+            sv.run(sys.stdin.buffer)
+        else:
+            with open(path, "rb") as f:
+                sv.run(f)
+    finally:
+        refresher.stop()
+
+    return 0
+
+
+def run_serve(args, sm, cachedir):
+    from greenpass.daemon import VerificationService, make_server
+    from greenpass.refresh import start_refresher
+
+    cup = get_certificate_updater(cachedir, args.key, args.max_age)
+    logic = LogicManager(cachedir, args.fast_verify,
+                         result_cache_ttl=args.cache_results)
+    service = VerificationService(sm, logic, cup,
+                                  enable_blocklist=not args.no_block_list)
+
+    server = make_server(args.serve, service, args.verbose)
+    print("[+] Listening on {}".format(server.get_url()), flush=True)
+
+    # Keep settings and keys fresh while serving
+    refresher = start_refresher(args.max_age, sm, cup.trust_store)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        refresher.stop()
+        server.server_close()
+
+    return 0
+
+
 def main():
     # Get the arguments
+    args_started = time.perf_counter()
     args = setup_argparse()
+    args_done = time.perf_counter()
+
+    if args.profile is None and args.cprofile is None:
+        return run(args)
+
+    from greenpass.profiling import Profile
+    profile = Profile(args.profile, args.cprofile)
+    profile.add_span("imports", IMPORTS_STARTED, IMPORTS_DONE)
+    profile.add_span("args", args_started, args_done)
+    profile.start()
+    try:
+        with metrics.timer("main"):
+            return run(args)
+    finally:
+        profile.stop()
+
+
+def run(args):
     # Configure the cache directory
     cachedir = manage_cache(args.cachedir, args.no_cache, args.clear_cache)
     # Configure colored output
     colored = init_colors(args.no_color, args.force_color)
 
-    sm = SettingsManager(cachedir, args.recovery_expiration)
+    # Count also the downloads done while starting the daemon
+    if args.serve is not None:
+        metrics.enable()
+
+    with metrics.timer("settings.load"):
+        sm = SettingsManager(cachedir, args.recovery_expiration,
+                             args.max_age,
+                             drl=args.drl and not args.no_block_list)
 
     language = get_language(locale.getdefaultlocale()[0])
     if args.language is not None:
@@ -195,6 +329,9 @@ def main():
     if args.at_date is not None:
         sm.set_at_date(args.at_date)
 
+    # The test devices list expires with the other downloaded data
+    get_value_sets().max_age = args.max_age
+
     (path, filetype) = get_filetype(args)
 
     if args.batch:
@@ -204,25 +341,31 @@ def main():
 
     if args.settings:
         out = om(colored)
-        out.dump_settings(sm)
+        with metrics.timer("output"):
+            out.dump_settings(sm)
         return 1
 
+    if args.stream:
+        if filetype != "txt":
+            print("[-] --stream requires --txt", file=sys.stderr)
+            return 1
+        return run_stream(args, sm, cachedir, path)
+
+    if args.serve is not None:
+        return run_serve(args, sm, cachedir)
+
     data = InputTransformer(path, filetype).get_data()
-    gpp = GreenPassParser(data)
+    with metrics.timer("parse"):
+        gpp = GreenPassParser(data)
 
     out = om(colored)
     if args.raw:
         gpp.dump(out)
         return 1
 
-    logic = LogicManager(cachedir)
+    logic = LogicManager(cachedir, args.fast_verify)
 
-    if args.key is not None:
-        cup = ForcedCertificateUpdater(args.key)
-    elif cachedir != '':
-        cup = CachedCertificateUpdater(cachedir)
-    else:
-        cup = CertificateUpdater()
+    cup = get_certificate_updater(cachedir, args.key, args.max_age)
 
     if args.verbose:
         cup.set_verbose()
@@ -234,11 +377,21 @@ def main():
         return 1
 
     cert = gpp.get_certificate()
-    res = logic.verify_certificate(cert, sm, cup,
-                                   enable_blocklist=not args.no_block_list)
-
-    out.print_cert(cert, cachedir=cachedir, language=language)
-    out.dump()
+    with metrics.timer("verify"):
+        res = logic.verify_certificate(
+            cert, sm, cup, enable_blocklist=not args.no_block_list
+        )
+
+    with metrics.timer("output"):
+        # Structured formats skip the human-readable report
+        if args.format != "text" and not args.batch:
+            from greenpass.stream import get_verdict
+            record_output = get_record_output(args.format)
+            record_output.write(get_verdict(res, cert))
+            record_output.close()
+        else:
+            out.print_cert(cert, cachedir=cachedir, language=language)
+            out.dump()
 
     # Unix return code is inverted
     return not res
@@ -16,9 +16,25 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import os
+
+# Every URL can be overridden from the environment, e.g. to use a local
+# mirror or a stand-in server during tests.
+
 # Base url to retrieve data (DGC)
-BASE_URL_DGC = "https://get.dgc.gov.it/v1/dgc/"
+BASE_URL_DGC = os.environ.get(
+    "GREENPASS_URL_DGC", "https://get.dgc.gov.it/v1/dgc/"
+)
 # Alternative base url to retrieve data (DGC)
-BASE_URL_DGCG = "https://dgcg.covidbevis.se/tp/"
+BASE_URL_DGCG = os.environ.get(
+    "GREENPASS_URL_DGCG", "https://dgcg.covidbevis.se/tp/"
+)
 # Base url to retrieve data (NHS)
-BASE_URL_NHS = "https://covid-status.service.nhsx.nhs.uk/"
+BASE_URL_NHS = os.environ.get(
+    "GREENPASS_URL_NHS", "https://covid-status.service.nhsx.nhs.uk/"
+)
+# Test devices list (JRC)
+TESTS_URL = os.environ.get(
+    "GREENPASS_URL_TESTS",
+    "https://covid-19-diagnostics.jrc.ec.europa.eu/devices/export"
+)
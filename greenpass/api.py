@@ -19,213 +19,476 @@
 import os
 import sys
 import json
+import time
 import base64
-import requests
-from OpenSSL import crypto
-from binascii import hexlify
-from bs4 import BeautifulSoup
+import threading
+import collections
+from concurrent.futures import Future, as_completed
 from cose.keys import CoseKey
 
+from greenpass import network
+from greenpass import metrics
 from greenpass.URLs import BASE_URL_DGC, BASE_URL_NHS, BASE_URL_DGCG
 
 
-# Update certificate signer
-class CertificateUpdater(object):
-    def __init__(self):
-        """Download certificates from the remote endpoint."""
-        self.verbose = False
+# Default time after which the signer keys are revalidated (seconds)
+DEFAULT_MAX_AGE = 24 * 60 * 60
 
-    def set_verbose(self):
-        self.verbose = True
+# Signer keys kept parsed in memory
+KEY_CACHE_SIZE = 256
 
-    # Get KEY index from online status page
-    @staticmethod
-    def _get_kid_idx(kid, _type="dgc"):
-        if _type == "dgc":
-            r = requests.get("{}/signercertificate/status".format(
-                BASE_URL_DGC
-            ))
-        elif _type == "nhs":
-            r = requests.get("{}/pubkeys/keys.json".format(BASE_URL_NHS))
+
+# Run fun in a daemon thread, return the Future of its result.  The
+# process does not wait at exit for the downloads nobody waits for.
+def _run_in_thread(fun, *args):
+    future = Future()
+
+    def run():
+        future.set_running_or_notify_cancel()
+        try:
+            result = fun(*args)
+        # The API modules exit on errors, hand the exit to the caller
+        except BaseException as e:
+            future.set_exception(e)
         else:
-            return ("unk", -1)
+            future.set_result(result)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+# Index of the signer keys, every key source is downloaded at most once
+#  and the keys are retrieved by kid without scanning the lists again.
+# The sources are downloaded concurrently, a cold lookup lasts as long
+# as the slowest download and not as all of them.
+class TrustStore(object):
+    def __init__(self, max_age=DEFAULT_MAX_AGE):
+        """Download the signer keys and index them by kid."""
+        # Sources in priority order
+        self.sources = (
+            ("nhs", self._load_nhs),
+            ("dgc", self._load_dgc),
+        )
+        self.max_age = max_age
+        self.indexes = {}
+        self.fetched = {}
+        # Validators and parsed content of every downloaded document
+        self.documents = {}
+        # Downloads in progress by source, shared by concurrent lookups
+        self.lock = threading.Lock()
+        self.loading = {}
+        # Increased every time the trusted keys of a source change
+        self.version = 0
+
+    # Download and parse url, if the document did not change since the
+    # last download the previously parsed content is returned.
+    def _fetch(self, url, parse):
+        validators, parsed = self.documents.get(url, (None, None))
+        r = network.get_if_modified(url, validators)
+        if r.status_code == 304 and parsed is not None:
+            return parsed
         if r.status_code != 200:
             print("[-] Error from API")
             sys.exit(1)
-        i = 0
-        hexkid = hexlify(kid)
-        for x in json.loads(r.text):
-            if _type == "dgc":
-                targetkid = hexlify(base64.b64decode(x))
-                out = i
-            if _type == "nhs":
-                targetkid = hexlify(base64.b64decode(x["kid"]))
-                out = targetkid
-            if targetkid == hexkid:
-                return (_type, out)
-            i += 1
-        return (_type, -1)
-
-    # Dispatch to correct Key IDX retrieve function
-    def get_kid_idx(self, kid):
-        k = self._get_kid_idx(kid, "nhs")
-        if k[1] != -1:
-            return k
-        k = self._get_kid_idx(kid, "dgc")
-        if self.verbose:
-            print("[ ] Kid: {} idx: {}".format(base64.b64encode(kid), k[1]))
 
-        if k[1] != -1:
-            return k
+        parsed = parse(r.text)
+        self.documents[url] = (network.get_validators(r), parsed)
+        return parsed
 
-        print("[-] Could not find certification authority")
-        sys.exit(1)
+    @staticmethod
+    def _parse_nhs(text):
+        index = {}
+        for x in json.loads(text):
+            index[base64.b64decode(x["kid"])] = base64.b64decode(
+                x["publicKey"]
+            )
+        return index
 
-    # Get key from DGC style repository
     @staticmethod
-    def get_key_dgc(idx):
-        certificate = None
-        r = requests.get("{}".format(BASE_URL_DGCG))
-        if r.status_code != 200:
-            print("[-] Error from API")
-            sys.exit(1)
+    def _parse_dgc_status(text):
+        return frozenset(base64.b64decode(x) for x in json.loads(text))
 
-        soup = BeautifulSoup(r.text, 'html.parser')
+    @staticmethod
+    def _parse_dgcg(text):
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(text, 'html.parser')
         trust_list_json = soup.find("code", {"id": "trust-list-json"})
         trust_list = json.loads(trust_list_json.string)
-        target = base64.b64encode(idx).decode()
+
+        certificates = {}
         for country in trust_list["dsc_trust_list"].values():
             for el in country["keys"]:
-                if el["kid"] == target:
-                    certificate = base64.b64decode(el["x5c"][0])
-                    break
+                kid = base64.b64decode(el["kid"])
+                if kid not in certificates:
+                    certificates[kid] = base64.b64decode(el["x5c"][0])
+        return certificates
+
+    # Index the keys from NHS style repository
+    def _load_nhs(self):
+        return self._fetch("{}/pubkeys/keys.json".format(BASE_URL_NHS),
+                           self._parse_nhs)
+
+    # Index the keys from DGC style repository, only the kids listed in
+    # the status page are trusted, the certificates are retrieved from
+    # the DGCG trust list.  Both are downloaded at the same time.
+    def _load_dgc(self):
+        trusted = _run_in_thread(
+            self._fetch,
+            "{}/signercertificate/status".format(BASE_URL_DGC),
+            self._parse_dgc_status
+        )
+        certificates = self._fetch(BASE_URL_DGCG, self._parse_dgcg)
+        trusted = trusted.result()
+
+        return {
+            kid: certificates[kid]
+            for kid in trusted if kid in certificates
+        }
+
+    def _load_source(self, name, loader):
+        # The new index replaces the old one at once, lookups running
+        # in other threads see either the old or the new one.
+        metrics.inc("trust_store.loads")
+        index = loader()
+        # The first download only adds keys, the signatures already
+        # verified stay valid
+        old = self.indexes.get(name, None)
+        changed = old is not None and old != index
+        self.indexes[name] = index
+        self.fetched[name] = time.time()
+        # After the swap: a result verified with the old keys is never
+        # recorded with the new version
+        if changed:
+            with self.lock:
+                self.version += 1
+        return index
+
+    # Download the source in background, if it is not already being
+    # downloaded, return the Future of its index
+    def _load_async(self, name, loader):
+        with self.lock:
+            future = self.loading.get(name, None)
+            if future is None or future.done():
+                future = _run_in_thread(self._load_source, name, loader)
+                self.loading[name] = future
+        return future
+
+    # Download the sources concurrently, wait for all of them
+    def _load_all(self, sources):
+        futures = [self._load_async(name, loader) for name, loader in sources]
+        for future in futures:
+            future.result()
+
+    def is_expired(self, name):
+        return time.time() - self.fetched.get(name, 0) >= self.max_age
+
+    def load(self):
+        self._load_all([
+            (name, loader) for name, loader in self.sources
+            if name not in self.indexes or self.is_expired(name)
+        ])
+
+    # Revalidate every source already loaded
+    def refresh(self):
+        self._load_all([
+            (name, loader) for name, loader in self.sources
+            if name in self.indexes
+        ])
+
+    # Return the source and the key bound to kid.  The loaded sources
+    # are searched first, the missing or expired ones are then
+    # downloaded concurrently and the first one trusting the kid
+    # answers: the other downloads are not waited for, they complete in
+    # background and serve the following lookups.
+    def lookup(self, kid):
+        missing = []
+        for name, loader in self.sources:
+            index = self.indexes.get(name, None)
+            if index is None or self.is_expired(name):
+                missing.append((name, loader))
+                continue
+            certificate = index.get(kid, None)
+            if certificate is not None:
+                metrics.inc("trust_store.hits")
+                return name, certificate
+
+        futures = {
+            self._load_async(name, loader): name for name, loader in missing
+        }
+        error = None
+        for future in as_completed(futures):
+            try:
+                index = future.result()
+            # Another source can still trust the kid
+            except (Exception, SystemExit) as e:
+                error = error or e
+                continue
+            certificate = index.get(kid, None)
+            if certificate is not None:
+                metrics.inc("trust_store.hits")
+                return futures[future], certificate
+
+        if error is not None:
+            raise error
+        metrics.inc("trust_store.misses")
+        return None, None
+
+    def get_certificate(self, kid):
+        return self.lookup(kid)[1]
+
+    def __contains__(self, kid):
+        """Check if the kid is trusted."""
+        return self.get_certificate(kid) is not None
+
+
+# Key type required by every signature algorithm
+KEY_TYPES = {
+    "ES256": "EC2",
+    "PS256": "RSA",
+}
+
+# COSE curve names
+CURVES = {
+    "secp256r1": "P_256",
+    "secp384r1": "P_384",
+    "secp521r1": "P_521",
+}
+
+
+def _int_to_bytes(n):
+    return n.to_bytes(max(1, (n.bit_length() + 7) // 8), "big")
+
+
+# Parameters of a public key as COSE key attributes: X and Y for the
+# EC2 keys, N and E for the RSA keys.  None for other key types.
+def get_key_parameters(pubkey):
+    from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+    if isinstance(pubkey, ec.EllipticCurvePublicKey):
+        numbers = pubkey.public_numbers()
+        size = (pubkey.curve.key_size + 7) // 8
+        return {
+            "KTY":   "EC2",
+            "CURVE": CURVES.get(pubkey.curve.name, pubkey.curve.name),
+            "X":     numbers.x.to_bytes(size, "big"),
+            "Y":     numbers.y.to_bytes(size, "big"),
+        }
+    if isinstance(pubkey, rsa.RSAPublicKey):
+        numbers = pubkey.public_numbers()
+        return {
+            "KTY": "RSA",
+            "N":   _int_to_bytes(numbers.n),
+            "E":   _int_to_bytes(numbers.e),
+        }
+    return None
+
+
+# Least recently used keys in memory.  An entry is dropped max_age
+# seconds after it was loaded, as the cached key files it is checked
+# again against the trust store.
+class KeyCache(object):
+    def __init__(self, size=KEY_CACHE_SIZE, max_age=DEFAULT_MAX_AGE):
+        """Keep the last size keys used."""
+        self.size = size
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key, None)
+            if entry is None:
+                return None
+            if time.time() - entry[0] >= self.max_age:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.time(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
 
-        return certificate
 
-    # Return public key
+# Update certificate signer
+class CertificateUpdater(object):
+    def __init__(self, trust_store=None, max_age=DEFAULT_MAX_AGE):
+        """Download certificates from the remote endpoint."""
+        self.verbose = False
+        if trust_store is None:
+            trust_store = TrustStore(max_age)
+        self.trust_store = trust_store
+        self.keys = KeyCache(max_age=max_age)
+
+    def set_verbose(self):
+        self.verbose = True
+
+    # Return the public key of a DER certificate or of a DER
+    # SubjectPublicKeyInfo (e.g. a forced key file)
     def loadpubkey(self, certificate):
-        # Load certificate and dump the pubkey
-        x509 = crypto.load_certificate(crypto.FILETYPE_ASN1, certificate)
+        from cryptography import x509
+        from cryptography.hazmat.primitives import serialization
+        try:
+            cert = x509.load_der_x509_certificate(certificate)
+        except ValueError:
+            try:
+                return serialization.load_der_public_key(certificate)
+            except (ValueError, TypeError):
+                print("[-] Cannot load the public key of the signer")
+                sys.exit(1)
 
         if self.verbose:
             subject = ' '.join(map(
-                lambda x: x[1].decode(),
-                x509.get_subject().get_components()
+                lambda x: str(x.value),
+                cert.subject
             ))
             print("[ ] Signed with public key from")
             print("    {}".format(subject))
-        pubkey = crypto.dump_publickey(crypto.FILETYPE_ASN1, x509.get_pubkey())
-        return pubkey
-
-    @staticmethod
-    def extractpubkey(pubkey):
-        return pubkey[26::]
-
-    # Get key from NHS style repository
-    @staticmethod
-    def get_key_nhs(idx):
-        r = requests.get("{}/pubkeys/keys.json".format(BASE_URL_NHS))
-        for x in json.loads(r.text):
-            targetkid = hexlify(base64.b64decode(x["kid"]))
-
-            if targetkid == idx:
-                return base64.b64decode(x["publicKey"])
+        return cert.public_key()
 
-    # Retrieve key from remote repository
+    # Retrieve key from the trust store
     def get_certificate(self, kid):
-        keytype, idx = self.get_kid_idx(kid)
+        keytype, certificate = self.trust_store.lookup(kid)
+        if self.verbose:
+            print("[ ] Kid: {} source: {}".format(
+                base64.b64encode(kid), keytype
+            ))
 
-        if keytype == "nhs":
-            certificate = self.get_key_nhs(idx)
-        elif keytype == "dgc":
-            certificate = self.get_key_dgc(kid)
+        if certificate is None:
+            print("[-] Could not find certification authority")
+            sys.exit(1)
 
         return certificate
 
     def get_key(self, kid):
-        certificate = self.get_certificate(kid)
-
-        # Try to load the certificate
-        try:
-            pubkey = self.loadpubkey(certificate)
-        # TODO: Be more specific on the exceptions
-        except Exception:
-            pubkey = certificate
-
+        return self.loadpubkey(self.get_certificate(kid))
+
+    # Return the key cached under key for the current trusted keys, the
+    # keys cached before a change of the trust store are resolved again:
+    # the signer could have been removed.
+    def _get_cached_key(self, key, version):
+        entry = self.keys.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        return entry[1]
+
+    # Retrieve the public key, from the in-memory cache if already loaded
+    def get_public_key(self, kid):
+        # Read before the lookup, a key resolved while the trusted keys
+        # change is resolved again the next time
+        version = self.trust_store.version
+        pubkey = self._get_cached_key(kid, version)
+        if pubkey is not None:
+            metrics.inc("key_lru.hits")
+            return pubkey
+
+        metrics.inc("key_lru.misses")
+        pubkey = self.get_key(kid)
+        self.keys.put(kid, (version, pubkey))
         return pubkey
 
-    # Retrieve key and convert to coseobj
+    # Retrieve key and convert to coseobj, the keys already built are
+    # taken from the in-memory cache
     def get_key_coseobj(self, kid, alg="ES256"):
-        pubkey = self.get_key(kid)
-        return self.getcoseobj(pubkey, alg)
+        version = self.trust_store.version
+        coseobj = self._get_cached_key((kid, alg), version)
+        if coseobj is not None:
+            metrics.inc("key_lru.hits")
+            return coseobj
+
+        coseobj = self.getcoseobj(self.get_public_key(kid), alg)
+        if coseobj is not None:
+            self.keys.put((kid, alg), (version, coseobj))
+        return coseobj
 
     # Return COSE object from public key
     def getcoseobj(self, pubkey, alg="ES256"):
         if self.verbose:
             print("[ ] Algorithm: {}".format(alg))
 
-        if alg == "ES256":
-            return self._get_es256_cose_obj(pubkey)
-        if alg == "PS256":
-            return self._get_ps256_cose_obj(pubkey)
-        print("[ ] Unknown algorithm: {}".format(alg), file=sys.stderr)
-        return None
+        if alg not in KEY_TYPES:
+            print("[ ] Unknown algorithm: {}".format(alg), file=sys.stderr)
+            return None
 
-    @staticmethod
-    def _get_ps256_cose_obj(pubkey):
-        # Get N and E from the key
-        n = pubkey[32:-5]
-        e = pubkey[-3::]
-        kattr = {
-                "KTY":    "RSA",
-                "CURVE":  "P_256",
-                "ALG":    "PS256",
-                "E": e,
-                "N": n
-        }
-        return CoseKey.from_dict(kattr)
+        kattr = get_key_parameters(pubkey)
+        if kattr is None or kattr["KTY"] != KEY_TYPES[alg]:
+            print("[ ] The key cannot be used with {}".format(alg),
+                  file=sys.stderr)
+            return None
 
-    def _get_es256_cose_obj(self, pubkey):
-        pubkey = self.extractpubkey(pubkey)
-        # X is the first 32 bits, Y are the remaining ones
-        x = pubkey[1:int(len(pubkey)/2) + 1]
-        y = pubkey[int(len(pubkey)/2) + 1::]
-
-        # Create COSE key
-        kattr = {
-                "KTY":   "EC2",
-                "CURVE": "P_256",
-                "ALG":   "ES256",
-                "X":     x,
-                "Y":     y
-        }
+        kattr["ALG"] = alg
         return CoseKey.from_dict(kattr)
 
 
 # Cached version of Certificate Updater,
 #  saves and retrieves public keys using a cache directory
 class CachedCertificateUpdater(CertificateUpdater):
-    def __init__(self, cachedir):
+    def __init__(self, cachedir, trust_store=None, max_age=DEFAULT_MAX_AGE):
         """Download certificates from the remote endpoint and cache them."""
         self.cachedir = cachedir
+        self.max_age = max_age
         os.makedirs(cachedir, exist_ok=True)
-        super(CachedCertificateUpdater, self).__init__()
+        # Version of the trust store when every kid was last resolved
+        self.checked = {}
+        super(CachedCertificateUpdater, self).__init__(trust_store, max_age)
 
     def get_certificate(self, kid):
         # Replace / with a value that cannot be found in base64
         enckid = base64.b64encode(kid).decode().replace("/", ".")
         cachepath = os.path.join(self.cachedir, enckid)
         superclass = super(CachedCertificateUpdater, self)
+        version = self.trust_store.version
 
+        # Resolve the key again once the cached copy is too old or the
+        # trusted keys changed, the certificate could have been revoked.
         if not os.path.exists(cachepath):
-            with open(cachepath, "wb") as f:
-                f.write(superclass.get_certificate(kid))
+            metrics.inc("key_cache.misses")
+            self._save_certificate(cachepath, superclass.get_certificate(kid))
+        elif time.time() - os.path.getmtime(cachepath) >= self.max_age or \
+                self.checked.get(kid, version) != version:
+            metrics.inc("key_cache.stale")
+            # Keep using the cached copy if the endpoint is unreachable
+            try:
+                certificate = superclass.get_certificate(kid)
+                self._save_certificate(cachepath, certificate)
+            except network.RequestException:
+                print("[~] Cannot refresh the key, using the cached one",
+                      file=sys.stderr)
+        else:
+            metrics.inc("key_cache.hits")
+        self.checked[kid] = version
 
         with open(cachepath, "rb") as f:
             keybytes = f.read()
 
         return keybytes
 
+    # Concurrent lookups of the same kid write their own temporary file,
+    # the readers always see a complete key.  The file is created with
+    # the permissions of the other cached files (0666 less the umask).
+    @staticmethod
+    def _save_certificate(cachepath, certificate):
+        tmppath = os.path.join(os.path.dirname(cachepath),
+                               ".tmp-{}".format(os.urandom(8).hex()))
+        fd = os.open(tmppath,
+                     os.O_WRONLY | os.O_CREAT | os.O_EXCL |
+                     getattr(os, "O_BINARY", 0),
+                     0o666)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(certificate)
+            os.replace(tmppath, cachepath)
+        except BaseException:
+            os.remove(tmppath)
+            raise
+
 
 class ForcedCertificateUpdater(CertificateUpdater):
     def __init__(self, path):
@@ -238,3 +501,13 @@ class ForcedCertificateUpdater(CertificateUpdater):
             keybytes = f.read()
 
         return keybytes
+
+
+# Return the certificate updater for the configuration: a forced key,
+# a cache directory or the remote endpoints only.
+def get_certificate_updater(cachedir='', key=None, max_age=DEFAULT_MAX_AGE):
+    if key is not None:
+        return ForcedCertificateUpdater(key)
+    if cachedir != '':
+        return CachedCertificateUpdater(cachedir, max_age=max_age)
+    return CertificateUpdater(max_age=max_age)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+# Green Pass Parser
+# Copyright (C) 2021  Davide Berardi -- <berardi.dav@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Table driven base45 decoder (RFC 9285).  The input is translated to
+# the digit values with a single bytes.translate, which also marks the
+# characters outside of the alphabet, then the groups are decoded with
+# big integer arithmetic.
+
+CHARSET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:"
+
+INVALID = 0xff
+# Characters removed by bytes.rstrip()
+WHITESPACE = b" \t\n\r\x0b\x0c"
+_table = bytearray([INVALID] * 256)
+for _value, _char in enumerate(CHARSET):
+    _table[ord(_char)] = _value
+TABLE = bytes(_table)
+
+# Inputs longer than this are decoded with numpy, when available
+NUMPY_THRESHOLD = 4096
+
+# numpy is imported only when a long input needs it: None until then,
+# False if it is not installed
+_numpy = None
+
+
+def get_numpy():
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy or None
+
+
+def _getnonbase45chars(data):
+    return set(c for c in data.decode() if c not in CHARSET)
+
+
+# Decode the digit values into a new bytearray, allocated once with its
+# final size
+def _decode_values(values):
+    n = len(values)
+    tail = n % 3
+    if tail == 1:
+        raise ValueError("Invalid base45 length")
+
+    size = (n - tail) // 3 * 2
+    groups = values if tail == 0 else values[:n - tail]
+    out = bytearray(size + tail // 2)
+    if n >= NUMPY_THRESHOLD and get_numpy() is not None:
+        out[:size] = _decode_values_numpy(groups)
+    else:
+        _decode_groups(groups, out)
+
+    if tail == 2:
+        last = values[n - 2] + values[n - 1] * 45
+        if last > 0xff:
+            raise ValueError("Invalid base45 group")
+        out[size] = last
+    return out
+
+
+# Decode all the complete groups at once, without a loop in Python.
+# The digits are placed in the 32 bit lanes of three big integers, so a
+# single multiply-add computes a + b * 45 + c * 2025 for every group:
+# the result is at most 91124 and never carries into the next lane.
+# The low 16 bits of every lane are then copied to out.
+def _decode_groups(values, out):
+    k = len(values) // 3
+    lanes = bytearray(4 * k)
+    lanes[3::4] = values[0::3]
+    a = int.from_bytes(lanes, "big")
+    lanes[3::4] = values[1::3]
+    b = int.from_bytes(lanes, "big")
+    lanes[3::4] = values[2::3]
+    c = int.from_bytes(lanes, "big")
+
+    groups = (a + b * 45 + c * 2025).to_bytes(4 * k, "big")
+    # Groups over 0xffff set the second byte of their lane
+    if groups[1::4].count(0) != k:
+        raise ValueError("Invalid base45 group")
+    out[0:2 * k:2] = groups[2::4]
+    out[1:2 * k:2] = groups[3::4]
+
+
+# Vectorized decoding of complete groups, for bulk input
+def _decode_values_numpy(values):
+    numpy = get_numpy()
+    groups = numpy.frombuffer(values, dtype=numpy.uint8).reshape(-1, 3)
+    groups = groups.astype(numpy.uint32)
+    n = groups[:, 0] + groups[:, 1] * 45 + groups[:, 2] * 2025
+    if n.size > 0 and n.max() > 0xffff:
+        raise ValueError("Invalid base45 group")
+    return n.astype(">u2").tobytes()
+
+
+def b45encode(data):
+    out = bytearray()
+    for i in range(0, len(data) - 1, 2):
+        n = data[i] * 256 + data[i + 1]
+        n, c = divmod(n, 45)
+        e, d = divmod(n, 45)
+        out += bytes((ord(CHARSET[c]), ord(CHARSET[d]), ord(CHARSET[e])))
+    if len(data) % 2 == 1:
+        d, c = divmod(data[-1], 45)
+        out += bytes((ord(CHARSET[c]), ord(CHARSET[d])))
+    return bytes(out)
+
+
+def b45decode(data):
+    if isinstance(data, str):
+        data = data.encode()
+    values = bytes(data).translate(TABLE)
+    if INVALID in values:
+        raise ValueError("Invalid base45 character")
+    return bytes(_decode_values(values))
+
+
+# Decode the payload of a qrcode, starting at offset start (after the
+# HC1: prefix), in a single pass and without slicing the input.
+# Trailing whitespace is not decoded, like the data read from a file,
+# but it is still reported.  Return the decoded data (a bytearray) and
+# the set of the characters that are not part of the base45 alphabet.
+def decode_payload(data, start=0):
+    if not isinstance(data, bytes):
+        data = bytes(data)
+    values = data.translate(TABLE)
+
+    # Same as len(data.rstrip())
+    end = len(data)
+    while end > start and data[end - 1] in WHITESPACE:
+        end -= 1
+
+    invalid = set()
+    if values.find(INVALID, start) >= 0:
+        invalid = _getnonbase45chars(data[start:])
+        if values.find(INVALID, start, end) >= 0:
+            raise ValueError("Invalid base45 character")
+    return _decode_values(values[start:end]), invalid
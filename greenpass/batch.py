@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+# Green Pass Parser
+# Copyright (C) 2021  Davide Berardi -- <berardi.dav@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import collections
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from greenpass.api import get_certificate_updater
+from greenpass.input import InputTransformer
+from greenpass.logic import LogicManager
+from greenpass.settings import SettingsManager
+
+# State of the worker process, loaded once by _init_worker
+_worker = None
+
+# Inputs sent to a worker at once, their keys are resolved together
+DEFAULT_CHUNK_SIZE = 32
+
+
+class BatchResult(object):
+    def __init__(self, index, item, valid, summary=None, error=None):
+        """Result of the verification of a single batch input."""
+        self.index = index
+        self.item = item
+        self.valid = valid
+        self.summary = summary
+        self.error = error
+
+    def __repr__(self):
+        """Readable format for the batch result."""
+        return "BatchResult({}, {!r}, valid={})".format(
+            self.index, self.item, self.valid
+        )
+
+
+def get_filetype(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".png":
+        return "png"
+    if ext == ".pdf":
+        return "pdf"
+    return "txt"
+
+
+def _init_worker(sm, cachedir, key, enable_blocklist, fast_verify):
+    global _worker
+
+    cup = get_certificate_updater(cachedir, key)
+    _worker = (sm, LogicManager(cachedir, fast_verify), cup,
+               enable_blocklist)
+
+
+def _get_data(item):
+    if isinstance(item, bytes):
+        return item
+    if isinstance(item, tuple):
+        return InputTransformer(*item).get_data()
+    return InputTransformer(item, get_filetype(item)).get_data()
+
+
+# Decode, parse and verify a chunk of inputs in the worker process, the
+# keys of the chunk are resolved together.
+def _verify_chunk(jobs):
+    sm, logic, cup, enable_blocklist = _worker
+
+    results = [None] * len(jobs)
+    parsed = []
+    for i, (index, item) in enumerate(jobs):
+        try:
+            parsed.append((i, logic.parse_data(_get_data(item))))
+        # The input and API modules exit on errors, do not let a single
+        # input stop the whole batch.
+        except (Exception, SystemExit) as e:
+            results[i] = BatchResult(index, item, False, error=repr(e))
+
+    certs = [cert for _, cert in parsed]
+    try:
+        verdicts = logic.verify_certificates(certs, sm, cup, enable_blocklist)
+    except (Exception, SystemExit) as e:
+        verdicts = [(False, e)] * len(certs)
+
+    for (i, cert), (valid, error) in zip(parsed, verdicts):
+        index, item = jobs[i]
+        if error is not None:
+            results[i] = BatchResult(index, item, False, error=repr(error))
+        else:
+            results[i] = BatchResult(index, item, bool(valid),
+                                     summary=cert.get_summary())
+    return results
+
+
+# Verify multiple certificates using a pool of processes.
+# Inputs can be paths (the type is guessed from the extension),
+# (path, filetype) tuples or the raw content of the qrcode as bytes.
+class BatchVerifier(object):
+    def __init__(self, cachedir='', key=None, sm=None,
+                 enable_blocklist=True, workers=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE, fast_verify=False):
+        """Verify certificates in parallel using a process pool."""
+        # Load the settings once, the workers receive a copy
+        if sm is None:
+            sm = SettingsManager(cachedir)
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = max(1, chunk_size)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(sm, cachedir, key, enable_blocklist, fast_verify)
+        )
+
+    def __enter__(self):
+        """Use the verifier as context manager."""
+        return self
+
+    def __exit__(self, *_args):
+        """Shutdown the process pool."""
+        self.close()
+
+    def close(self):
+        self.executor.shutdown()
+
+    # Yield a BatchResult for every input, in input order if ordered is
+    # set, as soon as their chunk completes otherwise.
+    def verify(self, items, ordered=True):
+        # Bound the number of in-flight chunks to avoid loading
+        # the whole batch in memory.
+        max_pending = self.workers * 2
+        pending = collections.deque()
+
+        chunk = []
+        for job in enumerate(items):
+            chunk.append(job)
+            if len(chunk) < self.chunk_size:
+                continue
+            pending.append(self.executor.submit(_verify_chunk, chunk))
+            chunk = []
+            if len(pending) >= max_pending:
+                yield from self._drain(pending, ordered, max_pending - 1)
+
+        if chunk:
+            pending.append(self.executor.submit(_verify_chunk, chunk))
+        yield from self._drain(pending, ordered, 0)
+
+    @staticmethod
+    def _drain(pending, ordered, target):
+        while len(pending) > target:
+            if ordered:
+                yield from pending.popleft().result()
+                continue
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                yield from future.result()
+
+    def verify_all(self, items):
+        return list(self.verify(items))
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+
+# Green Pass Parser
+# Copyright (C) 2021  Davide Berardi -- <berardi.dav@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import sys
+import mmap
+import heapq
+import base64
+import struct
+import hashlib
+
+from greenpass import network
+from greenpass import metrics
+from greenpass.URLs import BASE_URL_DGC
+
+# File layout:
+#  header: magic, format version, number of entries, blocklist version
+#  entries: sorted SHA-256 digests of the blocked UVCIs
+MAGIC = b"GPBL"
+FORMAT = 1
+HEADER = struct.Struct("<4sIQQ")
+HASH_SIZE = hashlib.sha256().digest_size
+
+
+def uvci_hash(uvci):
+    return hashlib.sha256(uvci.encode()).digest()
+
+
+# Blocklist index stored as a sorted array of fixed-width hashes.
+# The file is memory mapped: it is not deserialized on load and its
+# pages are shared between the processes using the same cache.
+class BlocklistIndex(object):
+    def __init__(self, path):
+        """Open the blocklist index stored in path."""
+        self.path = path
+        self.mm = None
+        self.count = 0
+        self.version = 0
+
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+            magic, fmt, count, version = HEADER.unpack(header)
+            if magic != MAGIC or fmt != FORMAT:
+                raise ValueError("Invalid blocklist index {}".format(path))
+            if count > 0:
+                self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.count = count
+        self.version = version
+
+    # Write the index of the hashes to path, the file is replaced at once.
+    # Sorted and unique hashes are streamed to the file without being
+    # loaded in memory.
+    @staticmethod
+    def write(path, hashes, version=0, uvcis=None, presorted=False):
+        if not presorted:
+            hashes = sorted(set(hashes))
+        with open(path + ".tmp", "wb") as f:
+            f.write(HEADER.pack(MAGIC, FORMAT, 0, version))
+            count = 0
+            for h in hashes:
+                f.write(h)
+                count += 1
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, FORMAT, count, version))
+
+        # Keep the readable identifiers, used only to list the entries
+        if uvcis is not None:
+            with open(path + ".ids.tmp", "w") as f:
+                for uvci in uvcis:
+                    f.write(uvci + "\n")
+            os.replace(path + ".ids.tmp", path + ".ids")
+        elif os.path.exists(path + ".ids"):
+            os.remove(path + ".ids")
+
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def build(cls, path, uvcis, version=0):
+        uvcis = list(uvcis)
+        cls.write(path, map(uvci_hash, uvcis), version, uvcis)
+        return cls(path)
+
+    def get_hash(self, i):
+        offset = HEADER.size + i * HASH_SIZE
+        return self.mm[offset:offset + HASH_SIZE]
+
+    # Binary search of the hash in the sorted entries
+    def contains_hash(self, h):
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = self.get_hash(mid)
+            if entry < h:
+                lo = mid + 1
+            elif entry > h:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def hashes(self):
+        for i in range(self.count):
+            yield self.get_hash(i)
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+
+    def __contains__(self, uvci):
+        """Check if the UVCI is blocked."""
+        if uvci is None:
+            return False
+        return self.contains_hash(uvci_hash(uvci))
+
+    def __len__(self):
+        """Return the number of blocked UVCIs."""
+        return self.count
+
+    def __iter__(self):
+        """Iterate over the blocked UVCIs, or their hashes if unknown."""
+        ids = self.path + ".ids"
+        if os.path.exists(ids):
+            with open(ids, "r") as f:
+                for line in f:
+                    yield line.rstrip("\n")
+            return
+
+        for h in self.hashes():
+            yield base64.b64encode(h).decode()
+
+    # The index is shared by path, other processes map the same file
+    def __getstate__(self):
+        """Pickle only the path of the index."""
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        """Map the index again in the new process."""
+        self.__init__(state["path"])
+
+
+# Blocklist synchronized with the remote revocation list (DRL).
+# Only the changes since the local version are downloaded, they are
+# applied as an overlay of the base index and appended to a journal, the
+# base index is rewritten only when the overlay grows too much.
+class SyncedBlocklist(object):
+    def __init__(self, path=None, compact_ratio=0.1, min_compact=4096):
+        """Revocation list kept in sync incrementally."""
+        self.path = path
+        self.compact_ratio = compact_ratio
+        self.min_compact = min_compact
+        self.base = None
+        self.version = 0
+        # Hashes added and removed since the base index, replaced at once
+        # so that lookups never see a partially applied chunk.
+        self.overlay = (frozenset(), frozenset())
+
+        if path is not None:
+            self._load()
+
+    def _load(self):
+        if os.path.exists(self.path):
+            self.base = BlocklistIndex(self.path)
+            self.version = self.base.version
+
+        journal = self.path + ".journal"
+        if not os.path.exists(journal):
+            return
+
+        added, removed = set(), set()
+        with open(journal, "r") as f:
+            for line in f:
+                op, value = line[0], line[1:].rstrip("\n")
+                if op == "=":
+                    self.version = int(value)
+                    continue
+                h = base64.b64decode(value)
+                if op == "+":
+                    added.add(h)
+                    removed.discard(h)
+                elif op == "-":
+                    removed.add(h)
+                    added.discard(h)
+        self.overlay = (frozenset(added), frozenset(removed))
+
+    def _journal(self, insertions, deletions, version):
+        if self.path is None:
+            return
+        with open(self.path + ".journal", "a") as f:
+            for h in insertions:
+                f.write("+{}\n".format(base64.b64encode(h).decode()))
+            for h in deletions:
+                f.write("-{}\n".format(base64.b64encode(h).decode()))
+            f.write("={}\n".format(version))
+
+    def contains_hash(self, h):
+        added, removed = self.overlay
+        if h in added:
+            return True
+        if h in removed:
+            return False
+        return self.base is not None and self.base.contains_hash(h)
+
+    def __contains__(self, uvci):
+        """Check if the UVCI is revoked."""
+        if uvci is None:
+            return False
+        return self.contains_hash(uvci_hash(uvci))
+
+    def __len__(self):
+        """Return the number of revoked UVCIs."""
+        added, removed = self.overlay
+        if self.base is None:
+            return len(added)
+        contains = self.base.contains_hash
+        return len(self.base) + \
+            sum(1 for h in added if not contains(h)) - \
+            sum(1 for h in removed if contains(h))
+
+    def __iter__(self):
+        """Iterate over the hashes of the revoked UVCIs."""
+        for h in self.hashes():
+            yield base64.b64encode(h).decode()
+
+    # Sorted hashes of the base index with the overlay applied
+    def hashes(self):
+        added, removed = self.overlay
+        base = self.base.hashes() if self.base is not None else ()
+        last = None
+        for h in heapq.merge(base, sorted(added)):
+            if h != last and h not in removed:
+                yield h
+            last = h
+
+    # Apply the changes of a chunk, the cost depends only on the size
+    # of the change and of the overlay.
+    def apply(self, insertions, deletions, version):
+        insertions = frozenset(insertions)
+        deletions = frozenset(deletions)
+        added, removed = self.overlay
+
+        self._journal(insertions, deletions, version)
+        self.overlay = (
+            (added - deletions) | insertions,
+            (removed - insertions) | deletions
+        )
+        self.version = version
+
+        if self._needs_compaction():
+            self.compact()
+
+    def _needs_compaction(self):
+        if self.path is None:
+            return False
+        base = len(self.base) if self.base is not None else 0
+        size = sum(map(len, self.overlay))
+        return size > max(self.min_compact, base * self.compact_ratio)
+
+    # Replace the whole list, used when the local version is too old
+    def replace(self, hashes, version):
+        if self.path is None:
+            self.overlay = (frozenset(hashes), frozenset())
+            self.version = version
+            return
+
+        BlocklistIndex.write(self.path, hashes, version)
+        self._reset(version)
+
+    # Merge the overlay into the base index
+    def compact(self):
+        if self.path is None:
+            return
+        BlocklistIndex.write(self.path, self.hashes(), self.version,
+                             presorted=True)
+        self._reset(self.version)
+
+    def _reset(self, version):
+        base = BlocklistIndex(self.path)
+        if os.path.exists(self.path + ".journal"):
+            os.remove(self.path + ".journal")
+        self.base, self.overlay = base, (frozenset(), frozenset())
+        self.version = version
+
+    @staticmethod
+    def _decode(hashes):
+        return [base64.b64decode(h) for h in hashes]
+
+    # Download the changes since the local version, chunk by chunk.
+    # Return the number of chunks applied.
+    def sync(self):
+        r = network.get("{}/drl/check".format(BASE_URL_DGC),
+                        params={"version": self.version})
+        if r.status_code != 200:
+            print("[-] Error from API")
+            sys.exit(1)
+        check = r.json()
+        if check["version"] == self.version:
+            return 0
+
+        base_version = self.version
+        full = []
+        chunk = 1
+        last_chunk = check.get("totalChunk", 1)
+        while chunk <= last_chunk:
+            r = network.get("{}/drl".format(BASE_URL_DGC), params={
+                "version": base_version,
+                "chunk": chunk
+            })
+            if r.status_code != 200:
+                print("[-] Error from API")
+                sys.exit(1)
+            data = r.json()
+            last_chunk = data.get("lastChunk", last_chunk)
+            metrics.inc("drl.chunks")
+
+            delta = data.get("delta", None)
+            if delta is not None:
+                # Apply the delta as soon as the chunk is received, but
+                # keep the base version until the last chunk: if a chunk
+                # fails the next synchronization downloads all of them
+                # again, applying a chunk twice changes nothing.
+                version = base_version
+                if chunk >= last_chunk:
+                    version = data["version"]
+                self.apply(self._decode(delta.get("insertions", [])),
+                           self._decode(delta.get("deletions", [])),
+                           version)
+            else:
+                # The whole list, applied when complete
+                full.extend(self._decode(data.get("revokedUcvi", [])))
+                if chunk >= last_chunk:
+                    self.replace(full, data["version"])
+            chunk += 1
+
+        return chunk - 1
+
+    # Revalidate with the remote list
+    def refresh(self):
+        return self.sync() > 0
+
+    def __getstate__(self):
+        """Pickle only the path if the list is persisted."""
+        if self.path is None:
+            return self.__dict__
+        return {"path": self.path,
+                "compact_ratio": self.compact_ratio,
+                "min_compact": self.min_compact}
+
+    def __setstate__(self, state):
+        """Load the persisted list again in the new process."""
+        if "base" in state:
+            self.__dict__.update(state)
+            return
+        self.__init__(state["path"], state["compact_ratio"],
+                      state["min_compact"])
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+# Green Pass Parser
+# Copyright (C) 2021  Davide Berardi -- <berardi.dav@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import sys
+import json
+import time
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from greenpass import metrics
+from greenpass.input import InputTransformer
+from greenpass.stream import get_verdict
+
+# Refuse bodies bigger than this (a PDF with a qrcode is far smaller)
+MAX_BODY_SIZE = 16 * 1024 * 1024
+
+# Input type from the Content-Type of the request
+CONTENT_TYPES = {
+    "image/png": "png",
+    "application/pdf": "pdf",
+    "text/plain": "txt",
+}
+
+
+# Verification service: settings, keys and blocklist are loaded once and
+# shared by all the requests, verdicts are the same of the stream mode.
+class VerificationService(object):
+    def __init__(self, sm, logic, cup, enable_blocklist=True):
+        """Verify certificates keeping the state loaded."""
+        self.sm = sm
+        self.logic = logic
+        self.cup = cup
+        self.enable_blocklist = enable_blocklist
+        self.started = time.time()
+        # The daemon always exposes the instrumentation
+        metrics.enable()
+
+    def verify(self, body, filetype="txt"):
+        metrics.inc("daemon.requests")
+        try:
+            with metrics.timer("daemon.request"):
+                data = InputTransformer(body, filetype).get_data().strip()
+                valid, cert = self.logic.verify_data(
+                    data, self.sm, self.cup, self.enable_blocklist
+                )
+        # The input and API modules exit on errors, report it as a verdict
+        except (Exception, SystemExit) as e:
+            metrics.inc("daemon.errors")
+            return get_verdict(False, error=repr(e))
+
+        return get_verdict(valid, cert)
+
+    def health(self):
+        drl = self.sm.get_drl()
+        return {
+            "status": "ok",
+            "uptime": time.time() - self.started,
+            "settings_age": time.time() - self.sm.fetched,
+            "drl_version": drl.version if drl is not None else None,
+        }
+
+    # Counters and timers in the Prometheus text format
+    def metrics(self):
+        return metrics.get_metrics().to_prometheus() + \
+            "# TYPE greenpass_uptime_seconds gauge\n" \
+            "greenpass_uptime_seconds {:.3f}\n".format(
+                time.time() - self.started
+            )
+
+
+class VerificationHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def send_body(self, code, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = body.encode()
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, code, obj):
+        self.send_body(code, json.dumps(obj) + "\n")
+
+    def do_GET(self):
+        """Health and metrics endpoints."""
+        service = self.server.service
+        if self.path == "/health":
+            self.send_json(200, service.health())
+        elif self.path == "/metrics":
+            self.send_body(200, service.metrics(),
+                           "text/plain; version=0.0.4")
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        """Verify the certificate in the body of the request."""
+        if self.path != "/verify":
+            self.send_json(404, {"error": "not found"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.send_json(400, {"error": "invalid Content-Length"})
+            self.close_connection = True
+            return
+        if length > MAX_BODY_SIZE:
+            self.send_json(413, {"error": "request too large"})
+            self.close_connection = True
+            return
+        body = self.rfile.read(length)
+
+        content_type = self.headers.get("Content-Type", "text/plain")
+        filetype = CONTENT_TYPES.get(
+            content_type.split(";")[0].strip().lower(), "txt"
+        )
+        self.send_json(200, self.server.service.verify(body, filetype))
+
+    def address_string(self):
+        """Unix sockets have no client address."""
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super(VerificationHandler, self).log_message(format, *args)
+
+
+class VerificationServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service, verbose=False):
+        """HTTP server for the verification service."""
+        super(VerificationServer, self).__init__(address, VerificationHandler)
+        self.service = service
+        self.verbose = verbose
+
+    def get_url(self):
+        host, port = self.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+
+class UnixVerificationServer(socketserver.ThreadingMixIn,
+                             socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, service, verbose=False):
+        """HTTP server for the verification service on a Unix socket."""
+        if os.path.exists(path):
+            os.remove(path)
+        super(UnixVerificationServer, self).__init__(path,
+                                                     VerificationHandler)
+        self.service = service
+        self.verbose = verbose
+
+    def get_url(self):
+        return "unix:{}".format(self.server_address)
+
+    def server_close(self):
+        super(UnixVerificationServer, self).server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+# Create the server for the address, either HOST:PORT or unix:PATH
+def make_server(address, service, verbose=False):
+    if address.startswith("unix:"):
+        return UnixVerificationServer(address[len("unix:"):], service,
+                                      verbose)
+
+    host, _, port = address.rpartition(":")
+    if host == "":
+        host = "127.0.0.1"
+    try:
+        port = int(port)
+    except ValueError:
+        print("[-] Invalid address {}, use HOST:PORT or unix:PATH".format(
+            address
+        ))
+        sys.exit(1)
+    return VerificationServer((host, port), service, verbose)
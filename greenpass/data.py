@@ -19,12 +19,14 @@
 import os
 import sys
 import json
+import time
+import threading
 import cbor2
-import requests
+from types import MappingProxyType
 
-TESTS_URL = (
-    "https://covid-19-diagnostics.jrc.ec.europa.eu/devices/export"
-)
+from greenpass import metrics
+from greenpass import network
+from greenpass.URLs import TESTS_URL
 
 
 class Localized_GreenPassKeyManager(object):
@@ -349,39 +351,140 @@ class EN_GreenPassKeyManager(Localized_GreenPassKeyManager):
         return "{} Date"
 
 
+# Localized managers by language, English for the other languages
+LOCALIZATIONS = {
+    "it": IT_GreenPassKeyManager,
+    "de": DE_GreenPassKeyManager,
+    "en": EN_GreenPassKeyManager,
+}
+
+
 class GreenPassKeyManager(object):
+    # The localized managers are never modified, every language is
+    # created once and shared
+    _localizations = {}
+
     def __init__(self):
         """Dispatch the localized key values."""
 
     def get_localization(self, language="en"):
-        if language == "it":
-            return IT_GreenPassKeyManager()
-        elif language == "de":
-            return DE_GreenPassKeyManager()
-        else:
-            return EN_GreenPassKeyManager()
-        return self.get_default()
+        cls = LOCALIZATIONS.get(language, EN_GreenPassKeyManager)
+        km = self._localizations.get(cls, None)
+        if km is None:
+            km = self._localizations.setdefault(cls, cls())
+        return km
 
     def get_default(self):
         return self.get_localization(language="en")
 
 
+# Value sets of the certificate fields, shared read-only by all the lookups
+VACCINE_NAMES = MappingProxyType({
+    "EU/1/20/1507": "Moderna",
+    "EU/1/20/1525": "Janssen",
+    "EU/1/20/1528": "Pfizer",
+    "EU/1/21/1529": "AstraZeneca",
+    "EU/1/XX/XXX1": "Sputnik-V",
+    "EU/1/XX/XXX2": "CVnCoV",
+    "EU/1/XX/XXX3": "EpiVacCorona",
+    "EU/1/XX/XXX4": "BBIBP-CorV",
+    "EU/1/XX/XXX5": "CoronaVac",
+})
+
+VACCINE_MANUFACTURERS = MappingProxyType({
+    "ORG-100001699": "AstraZeneca",
+    "ORG-100030215": "Biontech",
+    "ORG-100001417": "Janssen",
+    "ORG-100031184": "Moderna",
+    "ORG-100006270": "Curevac",
+    "ORG-100013793": "CanSino",
+    "ORG-100020693": "Sinopharm",
+    "ORG-100010771": "Sinopharm",
+    "ORG-100024420": "Sinopharm",
+    "ORG-100032020": "Novavax"
+})
+
+DISEASE_NAMES = MappingProxyType({
+    "840539006": "Covid19"
+})
+
+TEST_TYPES = MappingProxyType({
+    "LP6464-4":   "molecular",
+    "LP217198-3": "rapid"
+})
+
+# Time after which the list of the test devices is downloaded again
+TESTS_MAX_AGE = 24 * 60 * 60
+
+
+# Process-wide registry of the manufacturer names.  The test devices are
+# downloaded from the JRC database the first time they are needed and
+# again only after max_age seconds, every cache directory (or none) has
+# its own table, merged once with the vaccine manufacturers.
+class ValueSetRegistry(object):
+    def __init__(self, max_age=TESTS_MAX_AGE):
+        """Lazily loaded manufacturer names."""
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        # cachedir: (fetch time, manufacturer names)
+        self.manufacturers = {}
+
+    def get_manufacturers(self, cachedir=''):
+        entry = self.manufacturers.get(cachedir, None)
+        if entry is not None and time.time() - entry[0] < self.max_age:
+            return entry[1]
+
+        with self.lock:
+            # Another thread could have loaded it in the meantime
+            entry = self.manufacturers.get(cachedir, None)
+            if entry is None or time.time() - entry[0] >= self.max_age:
+                entry = self.load(cachedir, entry)
+                self.manufacturers[cachedir] = entry
+        return entry[1]
+
+    def load(self, cachedir, previous=None):
+        metrics.inc("value_sets.loads")
+        if cachedir == '':
+            tests = Manufacturer.get_tests_pn()
+        else:
+            tests = Manufacturer.get_cached_tests_pn(
+                cachedir, max_age=self.max_age
+            )
+
+        # The download failed, keep the names that were already known
+        if not tests and previous is not None:
+            return (time.time(), previous[1])
+
+        names = dict(VACCINE_MANUFACTURERS)
+        names.update(tests)
+        return (time.time(), MappingProxyType(names))
+
+    # Download again the tables already loaded
+    def refresh(self):
+        with self.lock:
+            for cachedir, entry in list(self.manufacturers.items()):
+                self.manufacturers[cachedir] = self.load(
+                    cachedir, (0, entry[1])
+                )
+
+    def clear(self):
+        with self.lock:
+            self.manufacturers = {}
+
+
+_value_sets = ValueSetRegistry()
+
+
+def get_value_sets():
+    return _value_sets
+
+
 # Vaccine names
 class Vaccine(object):
     def __init__(self, t):
         """Translate vaccine code to human-readable name."""
         self.t = t
-        self.pretty_name = {
-            "EU/1/20/1507": "Moderna",
-            "EU/1/20/1525": "Janssen",
-            "EU/1/20/1528": "Pfizer",
-            "EU/1/21/1529": "AstraZeneca",
-            "EU/1/XX/XXX1": "Sputnik-V",
-            "EU/1/XX/XXX2": "CVnCoV",
-            "EU/1/XX/XXX3": "EpiVacCorona",
-            "EU/1/XX/XXX4": "BBIBP-CorV",
-            "EU/1/XX/XXX5": "CoronaVac",
-        }
+        self.pretty_name = VACCINE_NAMES
 
     def get_pretty_name(self):
         return self.pretty_name.get(self.t, self.t)
@@ -392,32 +495,16 @@ class Manufacturer(object):
     def __init__(self, t, cachedir=''):
         """Translate manufacturer code to human-readable name."""
         self.t = t
-        # Vaccines
-        self.pretty_name = {
-            "ORG-100001699": "AstraZeneca",
-            "ORG-100030215": "Biontech",
-            "ORG-100001417": "Janssen",
-            "ORG-100031184": "Moderna",
-            "ORG-100006270": "Curevac",
-            "ORG-100013793": "CanSino",
-            "ORG-100020693": "Sinopharm",
-            "ORG-100010771": "Sinopharm",
-            "ORG-100024420": "Sinopharm",
-            "ORG-100032020": "Novavax"
-        }
-        # Testes
-        if cachedir == '':
-            self.pretty_name.update(self.get_tests_pn())
-        else:
-            self.pretty_name.update(self.get_cached_tests_pn(cachedir))
+        # Vaccines and tests
+        self.pretty_name = _value_sets.get_manufacturers(cachedir)
 
     @staticmethod
     def get_tests_pn():
         o = {}
         try:
-            r = requests.get(TESTS_URL, allow_redirects=True, timeout=10)
-        except requests.exceptions.ReadTimeout:
-            # The operation timed out, return empty value
+            r = network.get(TESTS_URL, allow_redirects=True)
+        except network.RequestException:
+            # The operation timed out or failed, return empty value
             return o
 
         if r.status_code != 200:
@@ -436,14 +523,20 @@ class Manufacturer(object):
 
         return o
 
-    def get_cached_tests_pn(self, cachedir):
+    @staticmethod
+    def get_cached_tests_pn(cachedir, max_age=None):
         testcache = os.path.join(cachedir, "tests")
 
         os.makedirs(cachedir, exist_ok=True)
 
-        if not os.path.exists(testcache):
-            with open(testcache, 'wb') as f:
-                cbor2.dump(self.get_tests_pn(), f)
+        expired = max_age is not None and os.path.exists(testcache) and \
+            time.time() - os.path.getmtime(testcache) >= max_age
+        if not os.path.exists(testcache) or expired:
+            tests = Manufacturer.get_tests_pn()
+            # Do not replace a valid cache with a failed download
+            if tests or not expired:
+                with open(testcache, 'wb') as f:
+                    cbor2.dump(tests, f)
 
         with open(testcache, 'rb') as f:
             try:
@@ -465,9 +558,7 @@ class Disease(object):
     def __init__(self, t):
         """Translate disease code to human-readable name."""
         self.t = t
-        self.pretty_name = {
-            "840539006": "Covid19"
-        }
+        self.pretty_name = DISEASE_NAMES
 
     def get_pretty_name(self):
         return self.pretty_name.get(self.t, self.t)
@@ -477,10 +568,7 @@ class TestType(object):
     def __init__(self, t):
         """Translate test code to human-readable name."""
         self.t = t
-        self._type = {
-            "LP6464-4":   "molecular",
-            "LP217198-3": "rapid"
-        }
+        self._type = TEST_TYPES
         self.pretty_name = self._type
 
     def get_type(self):
@@ -18,31 +18,17 @@
 
 import sys
 
-from greenpass.input import InputTransformer
-from greenpass.logic import LogicManager, GreenPassParser
-from greenpass.settings import SettingsManager
-from greenpass.api import CertificateUpdater
-from greenpass.output import NoneOutput
+from greenpass.batch import BatchVerifier
 
 if __name__ == "__main__":
     out = True
-    sm = SettingsManager('')
-    om = NoneOutput()
-    logic = LogicManager('')
-    cup = CertificateUpdater()
-    for i in sys.argv[1::]:
-        try:
-            data = InputTransformer(i, 'png').get_data()
-            gpp = GreenPassParser(data)
-            cert = gpp.get_certificate()
-            res = logic.verify_certificate(cert, sm, cup)
-        except Exception:
-            res = False
-        if res:
-            print("[+] Valid     {}".format(i))
-        else:
-            print("[-] Not Valid {}".format(i))
+    with BatchVerifier('') as bv:
+        for r in bv.verify([(i, 'png') for i in sys.argv[1::]]):
+            if r.valid:
+                print("[+] Valid     {}".format(r.item[0]))
+            else:
+                print("[-] Not Valid {}".format(r.item[0]))
 
-        out = out and res
+            out = out and r.valid
 
     sys.exit(out)
@@ -18,9 +18,8 @@
 
 import io
 import sys
-import fitz
-from PIL import Image
-from pyzbar import pyzbar
+
+from greenpass import metrics
 
 
 # Class to get input data from various sources.
@@ -31,8 +30,19 @@ from pyzbar import pyzbar
 class InputTransformer(object):
     def __init__(self, path, filetype):
         """Transform input to the format understood by the application."""
+        with metrics.timer("input.{}".format(filetype)):
+            self.data = self.transform(path, filetype)
+
+    def transform(self, path, filetype):
+        # The content can also be passed directly instead of a path
+        content = None
+        if isinstance(path, (bytes, bytearray)):
+            content = bytes(path)
+
         if filetype == "txt":
-            if path == "-":
+            if content is not None:
+                outdata = content
+            elif path == "-":
                 outdata = bytes(
                     sys.stdin.read().split("\n")[0].encode("ASCII")
                 )
@@ -40,13 +50,22 @@ class InputTransformer(object):
                 with open(path, 'rb') as f:
                     outdata = f.read()
         else:
+            # Image libraries are slow to load, import them only here
+            from PIL import Image
+            from pyzbar import pyzbar
+
             if filetype == "png":
+                if content is not None:
+                    path = io.BytesIO(content)
                 img = Image.open(path)
             elif filetype == "pdf":
                 # Convert PDF to JPG
-                pdf_file = fitz.open(path)
-                imagebytes = pdf_file.extract_image(6)["image"]
-                img = Image.open(io.BytesIO(imagebytes))
+                import fitz
+                if content is not None:
+                    pdf_file = fitz.open(stream=content, filetype="pdf")
+                else:
+                    pdf_file = fitz.open(path)
+                img = Image.open(io.BytesIO(self.get_pdf_image(pdf_file)))
             else:
                 print("[-] file format {} not recognized".format(filetype),
                       file=sys.stderr)
@@ -61,7 +80,26 @@ class InputTransformer(object):
                 sys.exit(1)
 
             outdata = output.data
-        self.data = outdata
+        return outdata
 
     def get_data(self):
         return self.data
+
+    # The qrcode is the sixth object of the Italian certificates, in the
+    # other documents use the first image.
+    @staticmethod
+    def get_pdf_image(pdf_file):
+        try:
+            image = pdf_file.extract_image(6)
+        # Not an image or missing object, depending on the version
+        except (ValueError, RuntimeError):
+            image = None
+        if image:
+            return image["image"]
+
+        for page in pdf_file:
+            for xref in page.get_images():
+                return pdf_file.extract_image(xref[0])["image"]
+
+        print("[-] Image not found", file=sys.stderr)
+        sys.exit(1)
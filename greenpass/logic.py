@@ -18,16 +18,21 @@
 
 import re
 import sys
+import copy
 import zlib
-import base45
 import json
 import cbor2
-import pytz
+import hashlib
+import functools
 
-from datetime import datetime
+from datetime import datetime, timezone
 from cose.headers import KID, Algorithm
 from cose.messages import CoseMessage
 
+from greenpass import b45
+from greenpass import metrics
+from greenpass import signature
+from greenpass.api import KeyCache
 from greenpass.data import TestType
 from greenpass.data import GreenPassKeyManager
 
@@ -64,35 +69,49 @@ class TestResult(object):
         return "Unknown"
 
 
+# Parsed dates by raw value, the same dates repeat a lot in batches and
+# datetimes are immutable, so they can be shared
+DATE_CACHE_SIZE = 4096
+
+# strptime on Python < 3.7 does not correctly parse the timezone format
+# with a colon inside: the date and the timezone are matched separately.
+DATE_TIME_RGX = re.compile(r"""
+    (
+        \d{4}-\d{2}-\d{2}T # Date
+        \d{2}:\d{2}:\d{2}  # Time
+    )
+    (
+        [+-]
+        \d{2}              # Timezone hours
+        (?::\d{2})         # Timezone minutes
+    )?
+    """, re.VERBOSE)
+
+DATE_RGX = re.compile(r"\d{4}-\d{2}-\d{2}$")
+
+# Not available on Python < 3.7
+_fromisoformat = getattr(datetime, "fromisoformat", None)
+
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
 def _parse_timestamp(d):
-    return datetime.fromtimestamp(d, pytz.utc)
+    return datetime.fromtimestamp(d, timezone.utc)
 
 
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
 def _parse_date_time(d):
     try:
-        # strptime on Python < 3.7 does not correctly parse the
-        # timezone format with a colon inside, remove the colon
-        # in the timezone specification.
-        rgx = r"""
-        (
-            \d{4}-\d{2}-\d{2}T # Date
-            \d{2}:\d{2}:\d{2}  # Time
-        )
-        (
-            [+-]
-            \d{2}              # Timezone hours
-            (?::\d{2})         # Timezone minutes
-        )?
-        """
-        compiled_regex = re.compile(rgx, re.VERBOSE)
-        r = compiled_regex.match(d)
+        r = DATE_TIME_RGX.match(d)
         date = r.group(1)
         zone = r.group(2)
 
+        if _fromisoformat is not None:
+            return _fromisoformat(date + (zone or "+00:00"))
+
         if zone is None:
             date += "+0000"
         else:
-            date += r.group(2).replace(":", "")
+            date += zone.replace(":", "")
 
         testcollectiondate = datetime.strptime(
             date, "%Y-%m-%dT%H:%M:%S%z"
@@ -103,16 +122,35 @@ def _parse_date_time(d):
     return testcollectiondate
 
 
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
 def _parse_date(d):
     if "T" in d:
-        d = _parse_date_time(d)
+        return _parse_date_time(d)
+
+    if _fromisoformat is not None and DATE_RGX.match(d):
+        d = _fromisoformat(d)
     else:
         d = datetime.strptime(d, "%Y-%m-%d")
-        d = pytz.utc.localize(d, is_dst=None).astimezone(pytz.utc)
-    return d
+    return d.replace(tzinfo=timezone.utc)
 
 
 class Certificate(object):
+    # Compact layout, batches can hold a large number of certificates
+    __slots__ = (
+        "k", "release_date", "expiration_date", "dose_number",
+        "total_doses", "validity_from", "validity_until", "vaccine_pn",
+        "vaccine_date", "test_type", "target_disease",
+        "test_collection_date", "certificate_id", "expired",
+        "hours_to_valid", "remaining_hours", "blocklisted", "sign_alg",
+        "kid", "_type", "test_result", "verified", "manufacturer",
+        "date_of_collection", "vaccination_date", "vaccine_type", "info",
+        "filter_table", "parent",
+    )
+
+    # Filter tables by certificate and key manager class, the keys do
+    # not change between instances
+    _filter_tables = {}
+
     def __init__(self, k):
         """Certificate class transcription."""
         self.k = k
@@ -141,6 +179,7 @@ class Certificate(object):
         self.date_of_collection = None
         self.vaccination_date = None
         self.vaccine_type = None
+        self.parent = None
 
         self.info = {
             "qr": {},
@@ -149,23 +188,33 @@ class Certificate(object):
         }
 
         # Filter table to process data
-        self.filter_table = {
-            self.k.get_target_disease()[0]:     self.set_target_disease,
-            self.k.get_dose_number()[0]:        self.set_dose_number,
-            self.k.get_total_doses()[0]:        self.set_total_doses,
-            self.k.get_certificate_id()[0]:     self.set_certificate_id,
-            self.k.get_validity_from()[0]:      self.set_validity_from,
-            self.k.get_validity_until()[0]:     self.set_validity_until,
-            self.k.get_vaccine_type()[0]:       self.set_vaccine_type,
-            self.k.get_test_type()[0]:          self.set_test_type,
-            self.k.get_manufacturer()[0]:       self.set_manufacturer,
-            self.k.get_vaccine_pn()[0]:         self.set_vaccine_pn,
-            self.k.get_release_date()[0]:       self.set_release_date,
-            self.k.get_expiration_date()[0]:    self.set_expiration_date,
-            self.k.get_date_of_collection()[0]: self.set_date_of_collection,
-            self.k.get_vaccination_date()[0]:   self.set_vaccination_date,
-            self.k.get_test_result()[0]:        self.set_test_result,
-        }
+        self.filter_table = self.get_filter_table(k)
+
+    # Setters (unbound) of the values used to verify the certificate,
+    # by key of the qrcode
+    @classmethod
+    def get_filter_table(cls, k):
+        table = cls._filter_tables.get((cls, type(k)), None)
+        if table is None:
+            table = {
+                k.get_target_disease()[0]:     cls.set_target_disease,
+                k.get_dose_number()[0]:        cls.set_dose_number,
+                k.get_total_doses()[0]:        cls.set_total_doses,
+                k.get_certificate_id()[0]:     cls.set_certificate_id,
+                k.get_validity_from()[0]:      cls.set_validity_from,
+                k.get_validity_until()[0]:     cls.set_validity_until,
+                k.get_vaccine_type()[0]:       cls.set_vaccine_type,
+                k.get_test_type()[0]:          cls.set_test_type,
+                k.get_manufacturer()[0]:       cls.set_manufacturer,
+                k.get_vaccine_pn()[0]:         cls.set_vaccine_pn,
+                k.get_release_date()[0]:       cls.set_release_date,
+                k.get_expiration_date()[0]:    cls.set_expiration_date,
+                k.get_date_of_collection()[0]: cls.set_date_of_collection,
+                k.get_vaccination_date()[0]:   cls.set_vaccination_date,
+                k.get_test_result()[0]:        cls.set_test_result,
+            }
+            cls._filter_tables[(cls, type(k))] = table
+        return table
 
     # Unstructured data (just for print, not used)
     def set_info(self, _type, key, val):
@@ -312,6 +361,9 @@ class Certificate(object):
     def verify(self):
         return self.parent.verify()
 
+    def verify_public_key(self, pubkey):
+        return self.parent.verify_public_key(pubkey)
+
     def get_type(self):
         # Calculate type if not set
         if self._type is None:
@@ -342,6 +394,21 @@ class Certificate(object):
             return False
         return tr.is_negative()
 
+    # Compact summary of the verification result, contains only plain
+    # values so that it can be serialized or sent to other processes.
+    def get_summary(self):
+        return {
+            "type":            self.get_type(),
+            "certificate_id":  self.get_certificate_id(),
+            "kid":             self.get_kid(),
+            "sign_alg":        self.get_sign_alg(),
+            "verified":        self.get_verified(),
+            "expired":         self.get_expired(),
+            "blocklisted":     self.get_blocklisted(),
+            "hours_to_valid":  self.get_hours_to_valid(),
+            "remaining_hours": self.get_remaining_hours(),
+        }
+
     def add_info(self, _type, key, val):
         # Filter none value
         if val is None:
@@ -350,25 +417,11 @@ class Certificate(object):
         # Filter value used to verify the validity of the
         # certificate
         if process_function is not None:
-            process_function(val)
+            process_function(self, val)
         else:
             self.set_info(_type, key, val)
 
 
-def _iscompletelybase45compatible(data):
-    s = data.decode()
-    return all(c in base45.BASE45_CHARSET for c in s)
-
-
-def _getnonbase45chars(data):
-    s = data.decode()
-    out = set()
-    for c in s:
-        if c not in base45.BASE45_CHARSET:
-            out.add(c)
-    return out
-
-
 # Parse a green pass file
 class GreenPassParser(object):
     def __init__(self, certification, km=GreenPassKeyManager()):
@@ -376,24 +429,27 @@ class GreenPassParser(object):
         k = km.get_default()
         self.k = k
 
-        unstripped_data = b":".join(certification.split(b":")[1::])
-        # Remove the initial HC1: part and decode the certificate
-        data = b":".join(certification.strip().split(b":")[1::])
-
-        self.not_completely_base45 = not _iscompletelybase45compatible(
-            unstripped_data
-        )
-        self.not_base45_chars = _getnonbase45chars(unstripped_data)
+        # Skip the initial HC1: part and decode the certificate,
+        # checking for non base45 characters at the same time
+        prefix = certification.find(b":")
+        start = prefix + 1 if prefix >= 0 else len(certification)
+        with metrics.timer("parse.base45"):
+            decoded, self.not_base45_chars = b45.decode_payload(
+                certification, start
+            )
+        self.not_completely_base45 = len(self.not_base45_chars) > 0
 
-        decoded = base45.b45decode(data)
-        uncompressed = zlib.decompress(decoded)
+        with metrics.timer("parse.zlib"):
+            uncompressed = zlib.decompress(decoded)
 
         # Get the COSE message
-        self.cose = CoseMessage.decode(uncompressed)
+        with metrics.timer("parse.cose"):
+            self.cose = CoseMessage.decode(uncompressed)
 
         # Extract kid and payload
         self.kid = self.get_kid_from_cose(self.cose.phdr, self.cose.uhdr)
-        self.payload = cbor2.loads(self.cose.payload)
+        with metrics.timer("parse.cbor"):
+            self.payload = cbor2.loads(self.cose.payload)
 
         self.qr_info = {
             k.get_release_country()[0]: self.payload[
@@ -565,6 +621,16 @@ class GreenPassParser(object):
     def verify(self):
         return self.cose.verify_signature()
 
+    # Verify the code with a public key of cryptography, without cose.
+    # Return None if the algorithm is not supported.
+    def verify_public_key(self, pubkey):
+        alg = self.get_sign_alg()
+        if not signature.is_supported(alg):
+            return None
+        return signature.verify(pubkey, alg,
+                                signature.get_sig_structure(self.cose),
+                                self.cose.signature)
+
     # Dump the content of the payload in JSON format
     def dump(self, om):
         om.rawdump(json.dumps(self.payload))
@@ -590,20 +656,48 @@ class GreenPassParser(object):
         return c
 
 
+# Threads resolving the keys of a batch of certificates
+DEFAULT_PREFETCH_WORKERS = 8
+
+# Verified certificates kept by the result cache
+RESULT_CACHE_SIZE = 1024
+
+
 # Logic Manager, retrieve information from the certificate and set
 #  output.
 class LogicManager(object):
-    def __init__(self, cachedir):
+    def __init__(self, cachedir, fast_verify=False, result_cache_ttl=None):
         """Verification of the certificate."""
         self.cachedir = cachedir
+        # Verify ES256 and PS256 with the keys of cryptography, see
+        # greenpass.signature
+        self.fast_verify = fast_verify
+        # Certificates with a verified signature by hash of the qrcode
+        # content, only the checks depending on the time and on the
+        # blocklist are done again when the same qrcode is scanned
+        self.results = None
+        if result_cache_ttl is not None:
+            self.results = KeyCache(RESULT_CACHE_SIZE, result_cache_ttl)
 
     # Verify certificate
-    @staticmethod
-    def verify_certificate(cert, sm, cup,
+    def verify_certificate(self, cert, sm, cup,
                            enable_blocklist=True,
                            raw=False,
                            verificator_key=None):
+        usable = self.check_certificate(cert, sm, enable_blocklist)
+        verified = self.verify_signature(cert, cup, verificator_key,
+                                         self.fast_verify)
+        cert.set_verified(verified)
 
+        valid = verified and usable
+        metrics.inc("verify.valid" if valid else "verify.invalid")
+        return valid
+
+    # Check the validity period, the test result and the blocklist, the
+    # checks that depend on the time and on the settings.  Return
+    # whether the certificate can be accepted, signature aside.
+    @staticmethod
+    def check_certificate(cert, sm, enable_blocklist=True):
         expired = False
         blocklisted = False
         hours_to_valid = None
@@ -660,20 +754,148 @@ class LogicManager(object):
         # Check blocklist by ID
         cert.set_blocklisted(blocklisted)
 
-        alg = cert.get_sign_alg()
-        key = cup.get_key_coseobj(cert.get_kid(), alg=alg)
-        cert.set_key(key)
-        verified = cert.verify()
-
         unknown_cert = not cert.get_type() == "vaccine"
         unknown_cert = unknown_cert and not cert.get_type() == "test"
         unknown_cert = unknown_cert and not cert.get_type() == "recovery"
 
-        cert.set_verified(verified)
+        usable = not expired
+        usable = usable and not positive
+        usable = usable and not unknown_cert
+        usable = usable and not blocklisted
+        return usable
 
-        valid = verified
-        valid = valid and not expired
-        valid = valid and not positive
-        valid = valid and not unknown_cert
-        valid = valid and not blocklisted
-        return valid
+    # Verify the signature of the certificate
+    @staticmethod
+    def verify_signature(cert, cup, verificator_key=None, fast_verify=False):
+        # The key can be resolved in advance, e.g. for a batch: a public
+        # key of cryptography with fast_verify, a COSE key otherwise
+        key = verificator_key
+        alg = cert.get_sign_alg()
+        if fast_verify and signature.is_supported(alg):
+            if key is None:
+                with metrics.timer("key.resolve"):
+                    key = cup.get_public_key(cert.get_kid())
+            with metrics.timer("verify.signature"):
+                verified = cert.verify_public_key(key)
+            metrics.inc("verify.signatures")
+        else:
+            if key is None:
+                with metrics.timer("key.resolve"):
+                    key = cup.get_key_coseobj(cert.get_kid(), alg=alg)
+            # No key for the algorithm, the signature cannot be verified
+            verified = False
+            if key is not None:
+                cert.set_key(key)
+                with metrics.timer("verify.signature"):
+                    verified = cert.verify()
+                metrics.inc("verify.signatures")
+        return verified
+
+    # Parse the content of a qrcode, return the certificate
+    @staticmethod
+    def parse_data(data):
+        with metrics.timer("parse"):
+            cert = GreenPassParser(data).get_certificate()
+        if cert is None:
+            raise UnrecognizedException("Multiple certificates")
+        return cert
+
+    # Resolve the key of every distinct kid (and algorithm) of the
+    # certificates, in parallel.  Return a dictionary from (kid, alg) to
+    # the COSE key or to the exception raised resolving it.
+    # With fast_verify the keys are public keys of cryptography.
+    @staticmethod
+    def prefetch_keys(certs, cup, workers=DEFAULT_PREFETCH_WORKERS,
+                      fast_verify=False):
+        kids = list(dict.fromkeys(
+            (cert.get_kid(), cert.get_sign_alg()) for cert in certs
+        ))
+
+        def resolve(kid_alg):
+            try:
+                with metrics.timer("key.resolve"):
+                    if fast_verify and signature.is_supported(kid_alg[1]):
+                        return cup.get_public_key(kid_alg[0])
+                    return cup.get_key_coseobj(kid_alg[0], alg=kid_alg[1])
+            # The API modules exit on errors, report it for the group
+            except (Exception, SystemExit) as e:
+                return e
+
+        metrics.inc("key.prefetched", len(kids))
+        if len(kids) <= 1 or workers <= 1:
+            return {kid_alg: resolve(kid_alg) for kid_alg in kids}
+
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(workers, len(kids))) as ex:
+            return dict(zip(kids, ex.map(resolve, kids)))
+
+    # Verify a batch of parsed certificates.  The distinct kids are
+    # resolved first, then the certificates are verified grouped by kid,
+    # sharing the same key.  Return a (validity, error) pair for every
+    # certificate, in order: error is the exception raised resolving
+    # the key, in that case the certificate is not verified.
+    def verify_certificates(self, certs, sm, cup, enable_blocklist=True,
+                            workers=DEFAULT_PREFETCH_WORKERS):
+        keys = self.prefetch_keys(certs, cup, workers, self.fast_verify)
+
+        groups = {}
+        for i, cert in enumerate(certs):
+            kid_alg = (cert.get_kid(), cert.get_sign_alg())
+            groups.setdefault(kid_alg, []).append(i)
+
+        results = [None] * len(certs)
+        for kid_alg, indexes in groups.items():
+            key = keys[kid_alg]
+            for i in indexes:
+                if isinstance(key, BaseException):
+                    certs[i].set_verified(False)
+                    results[i] = (False, key)
+                    continue
+                with metrics.timer("verify"):
+                    valid = self.verify_certificate(
+                        certs[i], sm, cup, enable_blocklist=enable_blocklist,
+                        verificator_key=key
+                    )
+                results[i] = (valid, None)
+        return results
+
+    # Version of the keys and of the revocation list, the cached
+    # results are dropped when it changes
+    @staticmethod
+    def get_results_version(sm, cup):
+        drl = sm.get_drl()
+        return (id(cup), cup.trust_store.version,
+                drl.version if drl is not None else None)
+
+    # Parse and verify the content of a qrcode, return the validity and
+    # the certificate
+    def verify_data(self, data, sm, cup, enable_blocklist=True):
+        if self.results is None:
+            cert = self.parse_data(data)
+            with metrics.timer("verify"):
+                valid = self.verify_certificate(
+                    cert, sm, cup, enable_blocklist=enable_blocklist
+                )
+            return valid, cert
+
+        digest = hashlib.sha256(data).digest()
+        version = self.get_results_version(sm, cup)
+        entry = self.results.get(digest)
+        if entry is not None and entry[0] == version:
+            metrics.inc("result_cache.hits")
+            # Concurrent requests must not share the certificate
+            cert = copy.copy(entry[1])
+            with metrics.timer("verify"):
+                valid = self.check_certificate(cert, sm, enable_blocklist)
+            metrics.inc("verify.valid" if valid else "verify.invalid")
+            return valid, cert
+
+        metrics.inc("result_cache.misses")
+        cert = self.parse_data(data)
+        with metrics.timer("verify"):
+            valid = self.verify_certificate(
+                cert, sm, cup, enable_blocklist=enable_blocklist
+            )
+        if cert.get_verified():
+            self.results.put(digest, (version, copy.copy(cert)))
+        return valid, cert
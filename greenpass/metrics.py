@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+# Green Pass Parser
+# Copyright (C) 2021  Davide Berardi -- <berardi.dav@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Counters and stage timers of the verification.  The instrumentation is
+# disabled by default: every call returns after checking a flag, and
+# timer() returns a shared no-op context manager.
+#   from greenpass import metrics
+#   metrics.enable()
+#   with metrics.timer("parse"):
+#       ...
+#   metrics.inc("key_cache.hit")
+#   metrics.get_metrics().to_dict()
+
+import time
+import threading
+
+
+class _NullTimer(object):
+    def __enter__(self):
+        """Nothing to measure."""
+        return self
+
+    def __exit__(self, *_args):
+        """Nothing to record."""
+        return False
+
+
+_null_timer = _NullTimer()
+
+
+class _Timer(object):
+    def __init__(self, metrics, name):
+        """Measure the time spent in a block."""
+        self.metrics = metrics
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        """Start measuring."""
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_args):
+        """Record the elapsed time."""
+        self.metrics.observe(self.name, time.perf_counter() - self.start,
+                             self.start)
+        return False
+
+
+class Metrics(object):
+    def __init__(self):
+        """Registry of counters and timers."""
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.counters = {}
+        # name: [count, total seconds, max seconds]
+        self.timers = {}
+        # Every measured block as (name, start, seconds, thread), only
+        # while tracing
+        self.trace = None
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.timers = {}
+
+    def inc(self, name, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds, start=None):
+        if not self.enabled:
+            return
+        with self.lock:
+            if self.trace is not None:
+                if start is None:
+                    start = time.perf_counter() - seconds
+                self.trace.append((name, start, seconds,
+                                   threading.get_ident()))
+            timer = self.timers.get(name, None)
+            if timer is None:
+                self.timers[name] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+
+    def timer(self, name):
+        if not self.enabled:
+            return _null_timer
+        return _Timer(self, name)
+
+    # Record the blocks measured from now on, also enables the metrics
+    def start_trace(self):
+        with self.lock:
+            self.trace = []
+        self.enable()
+
+    # Stop recording, return the recorded blocks
+    def stop_trace(self):
+        with self.lock:
+            trace, self.trace = self.trace or [], None
+        return trace
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "counters": dict(self.counters),
+                "timers": {
+                    name: {"count": t[0], "total": t[1], "max": t[2]}
+                    for name, t in self.timers.items()
+                },
+            }
+
+    # Prometheus text exposition format, names are prefixed and the
+    # dots replaced by underscores
+    def to_prometheus(self, prefix="greenpass"):
+        data = self.to_dict()
+        lines = []
+        for name, value in sorted(data["counters"].items()):
+            metric = "{}_{}_total".format(prefix, name.replace(".", "_"))
+            lines.append("# TYPE {} counter".format(metric))
+            lines.append("{} {}".format(metric, value))
+        for name, t in sorted(data["timers"].items()):
+            metric = "{}_{}_seconds".format(prefix, name.replace(".", "_"))
+            lines.append("# TYPE {} summary".format(metric))
+            lines.append("{}_count {}".format(metric, t["count"]))
+            lines.append("{}_sum {:.6f}".format(metric, t["total"]))
+            lines.append("# TYPE {}_max gauge".format(metric))
+            lines.append("{}_max {:.6f}".format(metric, t["max"]))
+        return "\n".join(lines) + "\n"
+
+
+# Registry used by the greenpass modules
+_metrics = Metrics()
+
+
+def get_metrics():
+    return _metrics
+
+
+def enable():
+    _metrics.enable()
+
+
+def disable():
+    _metrics.disable()
+
+
+def reset():
+    _metrics.reset()
+
+
+def inc(name, value=1):
+    if _metrics.enabled:
+        _metrics.inc(name, value)
+
+
+def timer(name):
+    if not _metrics.enabled:
+        return _null_timer
+    return _Timer(_metrics, name)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+# Green Pass Parser
+# Copyright (C) 2021  Davide Berardi -- <berardi.dav@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# requests is imported only when the first client is created, the
+# commands answered from the cache never load it.
+
+from greenpass import metrics
+from greenpass.URLs import BASE_URL_DGC, BASE_URL_NHS, BASE_URL_DGCG
+from greenpass.URLs import TESTS_URL
+
+# (connect, read) timeouts in seconds, selected by URL prefix
+DEFAULT_TIMEOUT = (5, 30)
+DEFAULT_TIMEOUTS = {
+    BASE_URL_DGC:  (5, 30),
+    BASE_URL_NHS:  (5, 30),
+    # The DGCG trust list is a big HTML page
+    BASE_URL_DGCG: (5, 60),
+    TESTS_URL:     (5, 10),
+}
+
+# Shared client, created on first use
+_client = None
+
+
+# HTTP client shared by every remote fetch, keeps the connections
+# alive in a pool so that each host costs a single handshake.
+class HTTPClient(object):
+    def __init__(self, timeouts=None, default_timeout=DEFAULT_TIMEOUT,
+                 retries=3, backoff=0.5, pool_size=10):
+        """Pooled HTTP session with timeouts and retries."""
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        if timeouts is None:
+            timeouts = DEFAULT_TIMEOUTS
+        self.timeouts = dict(timeouts)
+        self.default_timeout = default_timeout
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET", "HEAD"),
+            # Return the last response, callers check the status code
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size,
+                              max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+
+    def set_timeout(self, prefix, timeout):
+        self.timeouts[prefix] = timeout
+
+    # Return the timeout of the longest prefix matching url
+    def get_timeout(self, url):
+        timeout = self.default_timeout
+        match = ""
+        for prefix, t in self.timeouts.items():
+            if url.startswith(prefix) and len(prefix) > len(match):
+                match = prefix
+                timeout = t
+        return timeout
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.get_timeout(url))
+        metrics.inc("http.requests")
+        with metrics.timer("http.get"):
+            r = self.session.get(url, **kwargs)
+        if r.status_code == 304:
+            metrics.inc("http.not_modified")
+        elif r.status_code >= 400:
+            metrics.inc("http.errors")
+        return r
+
+    # Conditional GET, the server answers 304 if the resource did not
+    # change since the response the validators were taken from.
+    def get_if_modified(self, url, validators=None, **kwargs):
+        headers = dict(kwargs.pop("headers", {}))
+        if validators is not None:
+            if validators.get("etag", None) is not None:
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified", None) is not None:
+                headers["If-Modified-Since"] = validators["last_modified"]
+        return self.get(url, headers=headers, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+# RequestException is resolved on access, except clauses evaluate it
+# only when an exception is raised.
+def __getattr__(name):
+    if name == "RequestException":
+        from requests.exceptions import RequestException
+        return RequestException
+    raise AttributeError(
+        "module {!r} has no attribute {!r}".format(__name__, name)
+    )
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = HTTPClient()
+    return _client
+
+
+# Replace the shared client, e.g. to change timeouts or retries
+def set_client(client):
+    global _client
+    _client = client
+
+
+def get(url, **kwargs):
+    return get_client().get(url, **kwargs)
+
+
+def get_if_modified(url, validators=None, **kwargs):
+    return get_client().get_if_modified(url, validators, **kwargs)
+
+
+# Return the validators to revalidate the content of a response
+def get_validators(r):
+    return {
+        "etag":          r.headers.get("ETag", None),
+        "last_modified": r.headers.get("Last-Modified", None),
+    }
@@ -16,7 +16,10 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import io
 import sys
+import csv
+import json
 from termcolor import colored
 
 from greenpass.data import Disease
@@ -25,6 +28,12 @@ from greenpass.data import Vaccine
 from greenpass.data import TestType
 from greenpass.data import GreenPassKeyManager
 
+# Compiled lines of the report, by colored function, label and color.
+# The labels are localized, so every language gets its own lines.
+_templates = {}
+# Labels come from the certificate keys too, bound the compiled lines
+MAX_TEMPLATES = 4096
+
 
 class NoneOutput(object):
     def __init__(self, colored=colored):
@@ -99,48 +108,83 @@ class OutputManager(NoneOutput):
 
     def __init__(self, colored=colored):
         """Default printer manager."""
-        self.out = ""
+        # Every line is written to the buffer and printed at once by dump()
+        self.out = io.StringIO()
         self.colored = colored
 
+    # Line of the field, with the label and the color codes in place
+    def _get_template(self, infoname, indent, color=None):
+        key = (self.colored, infoname, indent, color)
+        template = _templates.get(key, None)
+        if template is None:
+            if len(_templates) >= MAX_TEMPLATES:
+                _templates.clear()
+            template = self._compile_template(infoname, indent, color)
+            _templates[key] = template
+        return template
+
+    def _compile_template(self, infoname, indent, color):
+        if indent:
+            line = "  {:28s} ".format(infoname)
+        else:
+            line = "{:30s} ".format(infoname)
+        line = line.replace("{", "{{").replace("}", "}}")
+        if color is None:
+            return line + "{}\n"
+        return line + self._get_colored_field(color) + "\n"
+
+    # The codes written by colored around any text
+    def _get_colored_field(self, color):
+        prefix, suffix = self.colored("\0", color).split("\0")
+        return prefix + "{!s}" + suffix
+
     def add_general_info(self, infoname, infoval):
         if infoval is not None:
-            self.out += "{:30s} {}\n".format(infoname, infoval)
+            self.out.write(
+                self._get_template(infoname, False).format(infoval)
+            )
 
     def add_cert_info(self, infoname, infoval):
         if infoval is not None:
-            self.out += "  {:28s} {}\n".format(infoname, infoval)
+            self.out.write(
+                self._get_template(infoname, True).format(infoval)
+            )
 
-    def add_general_info_ok(self, infoname, infoval):
+    def add_general_info_color(self, infoname, infoval, color):
         if infoval is not None:
-            self.add_general_info(infoname, self.colored(infoval, "green"))
+            self.out.write(
+                self._get_template(infoname, False, color).format(infoval)
+            )
 
-    def add_general_info_info(self, infoname, infoval):
+    def add_cert_info_color(self, infoname, infoval, color):
         if infoval is not None:
-            self.add_general_info(infoname, self.colored(infoval, "blue"))
+            self.out.write(
+                self._get_template(infoname, True, color).format(infoval)
+            )
+
+    def add_general_info_ok(self, infoname, infoval):
+        self.add_general_info_color(infoname, infoval, "green")
+
+    def add_general_info_info(self, infoname, infoval):
+        self.add_general_info_color(infoname, infoval, "blue")
 
     def add_general_info_warning(self, infoname, infoval):
-        if infoval is not None:
-            self.add_general_info(infoname, self.colored(infoval, "yellow"))
+        self.add_general_info_color(infoname, infoval, "yellow")
 
     def add_general_info_error(self, infoname, infoval):
-        if infoval is not None:
-            self.add_general_info(infoname, self.colored(infoval, "red"))
+        self.add_general_info_color(infoname, infoval, "red")
 
     def add_cert_info_ok(self, infoname, infoval):
-        if infoval is not None:
-            self.add_cert_info(infoname, self.colored(infoval, "green"))
+        self.add_cert_info_color(infoname, infoval, "green")
 
     def add_cert_info_info(self, infoname, infoval):
-        if infoval is not None:
-            self.add_cert_info(infoname, self.colored(infoval, "blue"))
+        self.add_cert_info_color(infoname, infoval, "blue")
 
     def add_cert_info_warning(self, infoname, infoval):
-        if infoval is not None:
-            self.add_cert_info(infoname, self.colored(infoval, "yellow"))
+        self.add_cert_info_color(infoname, infoval, "yellow")
 
     def add_cert_info_error(self, infoname, infoval):
-        if infoval is not None:
-            self.add_cert_info(infoname, self.colored(infoval, "red"))
+        self.add_cert_info_color(infoname, infoval, "red")
 
     def add_remaining_time(self, certtype, certdate, level,
                            remaining_days, km):
@@ -153,11 +197,17 @@ class OutputManager(NoneOutput):
         if level == 3:
             color = "red"
 
-        self.out += "  {:28s} {} ({})\n".format(
-            km.get_date_format().format(certtype),
-            self.colored(certdate, color),
-            self.colored(remaining_days, color)
-        )
+        label = km.get_date_format().format(certtype)
+        key = (self.colored, label, "remaining", color)
+        template = _templates.get(key, None)
+        if template is None:
+            field = self._get_colored_field(color)
+            template = "  {:28s} ".format(label).replace(
+                "{", "{{").replace("}", "}}") + \
+                field + " (" + field + ")\n"
+            _templates[key] = template
+
+        self.out.write(template.format(certdate, remaining_days))
 
     def get_not_yet_valid(self, hours_to_valid, km):
         return "{}, {:.0f} {}, {} {}".format(
@@ -196,7 +246,7 @@ class OutputManager(NoneOutput):
         )
 
     def dump(self, file=sys.stdout):
-        print(self.out, file=file)
+        print(self.out.getvalue(), file=file)
 
     def dump_settings(self, sm):
         print("Tests")
@@ -242,6 +292,18 @@ class OutputManager(NoneOutput):
         print("\nBlocked Pass IDs")
         for gp in sm.blocklist:
             print("  {}".format(gp))
+
+        drl = sm.get_drl()
+        if drl is not None:
+            print("\nRevocation List")
+            print("  {} {}".format(
+                self.colored("{:25s}".format("version"), "blue"),
+                drl.version
+            ))
+            print("  {} {}".format(
+                self.colored("{:25s}".format("revoked pass IDs"), "blue"),
+                len(drl)
+            ))
         print()
 
     def dump_cose(self, phdr, uhdr, signature):
@@ -412,3 +474,69 @@ class OutputManager(NoneOutput):
             km.get_verified()[1],
             km.get_key("_"+str(cert.get_verified()))[1]
         )
+
+
+# Structured output: one compact record (a verdict) per certificate,
+# written as soon as it is ready.
+class NDJSONOutput(object):
+    def __init__(self, file=sys.stdout):
+        """One JSON object per line."""
+        self.file = file
+
+    def write(self, record):
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def close(self):
+        pass
+
+
+class JSONOutput(NDJSONOutput):
+    def __init__(self, file=sys.stdout):
+        """JSON array of the records."""
+        super(JSONOutput, self).__init__(file)
+        self.separator = "[\n"
+
+    def write(self, record):
+        self.file.write(self.separator + json.dumps(record))
+        self.file.flush()
+        self.separator = ",\n"
+
+    def close(self):
+        # An empty array if nothing was written
+        if self.separator == "[\n":
+            self.file.write("[")
+        self.file.write("\n]\n")
+        self.file.flush()
+
+
+class CSVOutput(NDJSONOutput):
+    # Columns of the records, missing values are left empty
+    FIELDS = (
+        "line", "valid", "type", "certificate_id", "kid", "sign_alg",
+        "verified", "expired", "blocklisted", "hours_to_valid",
+        "remaining_hours", "error",
+    )
+
+    def __init__(self, file=sys.stdout):
+        """Comma separated values, with header."""
+        super(CSVOutput, self).__init__(file)
+        self.writer = csv.DictWriter(file, self.FIELDS,
+                                     extrasaction="ignore",
+                                     lineterminator="\n")
+        self.writer.writeheader()
+
+    def write(self, record):
+        self.writer.writerow(record)
+        self.file.flush()
+
+
+RECORD_OUTPUTS = {
+    "ndjson": NDJSONOutput,
+    "json":   JSONOutput,
+    "csv":    CSVOutput,
+}
+
+
+def get_record_output(name, file=sys.stdout):
+    return RECORD_OUTPUTS[name](file)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+# Green Pass Parser
+# Copyright (C) 2021  Davide Berardi -- <berardi.dav@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import json
+
+from greenpass import metrics
+
+
+# Profile of a single invocation: the blocks measured by the metrics
+# timers are written as Chrome trace events (chrome://tracing or
+# https://ui.perfetto.dev), optionally with a cProfile report.
+class Profile(object):
+    def __init__(self, trace_path=None, cprofile_path=None):
+        """Trace the verification stages of this process."""
+        self.trace_path = trace_path
+        self.cprofile_path = cprofile_path
+        self.spans = []
+        self.profiler = None
+
+    def start(self):
+        metrics.get_metrics().start_trace()
+        if self.cprofile_path is not None:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    # Add a block measured before the profile was started
+    def add_span(self, name, start, end):
+        self.spans.append((name, start, end - start, None))
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+        trace = self.spans + metrics.get_metrics().stop_trace()
+
+        if self.trace_path is not None:
+            with open(self.trace_path, "w") as f:
+                json.dump(self.get_trace_events(trace), f)
+        if self.profiler is not None:
+            self.write_cprofile()
+
+    @staticmethod
+    def get_trace_events(trace):
+        pid = os.getpid()
+        events = []
+        for name, start, seconds, thread in trace:
+            events.append({
+                "name": name,
+                "cat":  name.split(".")[0],
+                "ph":   "X",
+                "ts":   start * 1e6,
+                "dur":  seconds * 1e6,
+                "pid":  pid,
+                "tid":  thread or 0,
+            })
+        events.sort(key=lambda e: e["ts"])
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    # Text report sorted by cumulative time
+    def write_cprofile(self):
+        import pstats
+        with open(self.cprofile_path, "w") as f:
+            stats = pstats.Stats(self.profiler, stream=f)
+            stats.sort_stats("cumulative").print_stats()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+# Green Pass Parser
+# Copyright (C) 2021  Davide Berardi -- <berardi.dav@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sys
+import threading
+
+
+# Refresh settings, blocklist and signer keys in a background thread,
+# before they expire.  The targets must implement refresh() and swap the
+# new data in at once, verifications running in other threads keep
+# using the previous data and never wait for the network.
+class BackgroundRefresher(threading.Thread):
+    def __init__(self, interval, *targets):
+        """Periodically refresh the targets."""
+        super(BackgroundRefresher, self).__init__(daemon=True)
+        self.interval = interval
+        self.targets = targets
+        self.stopped = threading.Event()
+
+    def refresh(self):
+        for target in self.targets:
+            try:
+                target.refresh()
+            # The API modules exit on errors, keep the old data and
+            # retry at the next round.
+            except (Exception, SystemExit) as e:
+                print("[~] Cannot refresh {}: {!r}".format(
+                    type(target).__name__, e
+                ), file=sys.stderr)
+
+    def run(self):
+        """Refresh the targets every interval seconds until stopped."""
+        while not self.stopped.wait(self.interval):
+            self.refresh()
+
+    def stop(self):
+        self.stopped.set()
+
+
+# Shortest interval between two refreshes: with a max_age of zero (always
+# revalidate) the data is already revalidated when it is used, the
+# refresher must not download it again in a loop
+MIN_REFRESH_INTERVAL = 60
+
+
+# Start a refresher which updates the targets at a fraction of max_age,
+# so that the data never expires in the meantime.
+def start_refresher(max_age, *targets):
+    refresher = BackgroundRefresher(max(max_age / 2, MIN_REFRESH_INTERVAL),
+                                    *targets)
+    refresher.start()
+    return refresher
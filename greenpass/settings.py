@@ -19,43 +19,158 @@
 import re
 import os
 import sys
+import copy
+import time
 import cbor2
 import pytz
 import json
-import requests
 from datetime import datetime
 from tzlocal import get_localzone
 
+from greenpass import network
+from greenpass import metrics
+from greenpass.blocklist import BlocklistIndex, SyncedBlocklist
 from greenpass.URLs import BASE_URL_DGC
 
 
+# Default time after which the cached settings are revalidated (seconds)
+DEFAULT_MAX_AGE = 24 * 60 * 60
+
+
 # Retrieve settings from unified API endpoint
 class SettingsManager(object):
-    def __init__(self, cachedir='', consider_recovery_expiration=False):
+    def __init__(self, cachedir='', consider_recovery_expiration=False,
+                 max_age=DEFAULT_MAX_AGE, drl=False):
         """Download and parse the settings from API endpoint."""
         self.at_date = None
         self.cachedir = cachedir
-        self.blocklist = set()
+        self.max_age = max_age
+        self.validators = None
+        self.fetched = 0
+        self.state = ({}, {}, {}, set())
+        # Revocation list, synchronized incrementally
+        self.drl = None
+        if drl:
+            drlpath = None
+            if cachedir != '':
+                os.makedirs(cachedir, exist_ok=True)
+                drlpath = os.path.join(cachedir, "drl")
+            self.drl = SyncedBlocklist(drlpath)
+
         if cachedir != '':
             self.get_cached_settings()
         else:
             self.get_settings()
+            self.sync_drl()
         self.consider_recovery_expiration = consider_recovery_expiration
 
-    def get_cached_settings(self):
+    # The parsed settings are kept in a single tuple, a refresh replaces
+    # it at once so readers never see a partially updated state.
+    @property
+    def vaccines(self):
+        return self.state[0]
+
+    @property
+    def recovery(self):
+        return self.state[1]
+
+    @property
+    def test(self):
+        return self.state[2]
+
+    @property
+    def blocklist(self):
+        return self.state[3]
+
+    def _get_cache_paths(self):
         settings = os.path.join(self.cachedir, "settings")
+        return settings, settings + ".meta", settings + ".blocklist"
+
+    def get_cached_settings(self):
+        settings, meta, blocklist = self._get_cache_paths()
 
         os.makedirs(self.cachedir, exist_ok=True)
 
-        if not os.path.exists(settings):
-            with open(settings, 'wb') as f:
-                cbor2.dump(self.get_settings(), f)
+        # Caches written by older versions include the whole blocklist,
+        # download the settings again to create the index.
+        if os.path.exists(settings) and os.path.exists(blocklist):
+            with open(settings, 'rb') as f:
+                vaccines, recovery, test = cbor2.load(f)[:3]
+            self.state = (vaccines, recovery, test,
+                          BlocklistIndex(blocklist))
+            self.fetched = os.path.getmtime(settings)
+            if os.path.exists(meta):
+                with open(meta, 'r') as f:
+                    self.validators = json.load(f)
+
+        if not self.is_expired():
+            metrics.inc("settings.cache_hits")
+            # Revocation list never synchronized
+            if self.drl is not None and self.drl.version == 0:
+                self.sync_drl()
+            return
+
+        metrics.inc("settings.cache_misses")
+        # Nothing cached yet
+        if self.fetched == 0:
+            self.refresh()
+            return
 
-        with open(settings, 'rb') as f:
-            (self.vaccines,
-             self.recovery,
-             self.test,
-             self.blocklist) = cbor2.load(f)
+        # Keep using the stale settings if the endpoint is unreachable
+        try:
+            self.refresh()
+        except (network.RequestException, SystemExit):
+            print("[~] Cannot refresh the settings, using cached ones",
+                  file=sys.stderr)
+
+    def is_expired(self):
+        return time.time() - self.fetched >= self.max_age
+
+    def sync_drl(self):
+        if self.drl is not None:
+            self.drl.sync()
+
+    # Revalidate the settings with the remote endpoint, the settings are
+    # downloaded and parsed again only if they changed.  The revocation
+    # list is updated with the changes since the last synchronization.
+    # Return True if the settings were updated.
+    def refresh(self):
+        metrics.inc("settings.refreshes")
+        self.sync_drl()
+
+        r = network.get_if_modified(
+            "{}/settings".format(BASE_URL_DGC), self.validators
+        )
+        if r.status_code == 304:
+            self.fetched = time.time()
+            if self.cachedir != '':
+                os.utime(self._get_cache_paths()[0])
+            return False
+
+        # Parse in a copy, then swap the new state in
+        fresh = copy.copy(self)
+        fresh.parse_settings(r)
+        self.validators = network.get_validators(r)
+        self.state = fresh.state
+        self.fetched = time.time()
+
+        if self.cachedir != '':
+            self._save_cache()
+        return True
+
+    def _save_cache(self):
+        settings, meta, blocklist = self._get_cache_paths()
+        vaccines, recovery, test, uvcis = self.state
+
+        index = BlocklistIndex.build(blocklist, uvcis)
+        with open(settings + ".tmp", 'wb') as f:
+            cbor2.dump((vaccines, recovery, test), f)
+        os.replace(settings + ".tmp", settings)
+        with open(meta, 'w') as f:
+            json.dump(self.validators, f)
+
+        # Use the index instead of the parsed set
+        self.state = (vaccines, recovery, test, index)
 
     # Dispatchers
     def dispatch_vaccine(self, setting):
@@ -109,9 +224,7 @@ class SettingsManager(object):
         self.vaccines[field_type][vtype][daytype] = int(field_value)
 
     def dispatch_blocklist(self, setting):
-        self.blocklist = self.blocklist.union(set(
-            setting["value"].split(";")[:-1])
-        )
+        self.blocklist.update(setting["value"].split(";")[:-1])
 
     def dispatch_operating_system(self, setting):
         # Ignore app specific options
@@ -167,30 +280,33 @@ class SettingsManager(object):
             print("[~] Unknown field {}".format(setting["name"]))
 
     def get_settings(self):
-        r = requests.get("{}/settings".format(BASE_URL_DGC))
+        r = network.get("{}/settings".format(BASE_URL_DGC))
+        self.parse_settings(r)
+        self.validators = network.get_validators(r)
+        self.fetched = time.time()
+
+        return self.state
+
+    def parse_settings(self, r):
         if r.status_code != 200:
             print("[-] Error from API")
             sys.exit(1)
 
-        self.vaccines = {}
-        self.recovery = {
+        self.state = ({}, {
             "default": {},
             "pv": {},
             "NOT_IT": {},
             "IT": {}
-        }
-        self.test = {
+        }, {
             "molecular": {},
             "rapid": {}
-        }
+        }, set())
 
         settings = json.loads(r.text)
         # Dispatch and create the dicts
         for setting in settings:
             self.dispatch_setting(setting)
 
-        return self.vaccines, self.recovery, self.test, self.blocklist
-
     # Return the time that a test is still valid, negative time if expired
     def get_test_remaining_time(self, test_date, ttype):
         hours = self.test.get(ttype, 0)
@@ -266,8 +382,18 @@ class SettingsManager(object):
     def get_blocklist(self):
         return self.blocklist
 
+    def get_drl(self):
+        return self.drl
+
     def check_uvci_blocklisted(self, uvci):
-        return uvci in self.blocklist
+        metrics.inc("blocklist.lookups")
+        if self.drl is not None and uvci in self.drl:
+            metrics.inc("blocklist.hits")
+            return True
+        if uvci in self.blocklist:
+            metrics.inc("blocklist.hits")
+            return True
+        return False
 
     def checktime(self):
         if self.at_date is None:
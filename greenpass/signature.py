@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+# Green Pass Parser
+# Copyright (C) 2021  Davide Berardi -- <berardi.dav@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Verify the COSE_Sign1 signatures directly with the public keys of
+# cryptography: the key is loaded once per signer and no COSE key or
+# pure python ECDSA key is built for every certificate.
+#   sig_structure = get_sig_structure(cose)
+#   verify(pubkey, "ES256", sig_structure, cose.signature)
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import \
+    encode_dss_signature
+
+_ecdsa_sha256 = ec.ECDSA(hashes.SHA256())
+# Same salt length used by cose for PS256 (the digest size)
+_pss_sha256 = padding.PSS(mgf=padding.MGF1(hashes.SHA256()),
+                          salt_length=32)
+
+
+# Encoded protected headers by content, the signers use few of them
+MAX_HEADERS = 1024
+_headers = {}
+
+
+def _get_phdr_encoded(cose):
+    try:
+        key = tuple(cose.phdr.items())
+        encoded = _headers.get(key, None)
+    # Values that cannot be hashed are encoded every time
+    except TypeError:
+        return cose.phdr_encoded
+
+    if encoded is None:
+        encoded = cose.phdr_encoded
+        if len(_headers) >= MAX_HEADERS:
+            _headers.clear()
+        _headers[key] = encoded
+    return encoded
+
+
+# Head of a CBOR byte string, with the shortest length encoding
+def _bstr_head(length):
+    if length < 24:
+        return bytes((0x40 | length,))
+    if length < 0x100:
+        return bytes((0x58, length))
+    if length < 0x10000:
+        return b"\x59" + length.to_bytes(2, "big")
+    if length < 0x100000000:
+        return b"\x5a" + length.to_bytes(4, "big")
+    return b"\x5b" + length.to_bytes(8, "big")
+
+
+# Data signed by the issuer, the same built by cose: the array
+# ["Signature1", protected header encoded again, no external data,
+# payload]
+def get_sig_structure(cose):
+    phdr = _get_phdr_encoded(cose)
+    payload = cose.payload
+    return b"".join((
+        b"\x84\x6aSignature1", _bstr_head(len(phdr)), phdr,
+        b"\x40", _bstr_head(len(payload)), payload
+    ))
+
+
+def _verify_es256(pubkey, data, signature):
+    if not isinstance(pubkey, ec.EllipticCurvePublicKey) or \
+            pubkey.curve.name != "secp256r1":
+        return False
+    # COSE signatures are r || s, cryptography wants them DER encoded
+    if len(signature) != 64:
+        return False
+    signature = encode_dss_signature(
+        int.from_bytes(signature[:32], "big"),
+        int.from_bytes(signature[32:], "big")
+    )
+    try:
+        pubkey.verify(signature, data, _ecdsa_sha256)
+    except InvalidSignature:
+        return False
+    return True
+
+
+def _verify_ps256(pubkey, data, signature):
+    if not isinstance(pubkey, rsa.RSAPublicKey):
+        return False
+    try:
+        pubkey.verify(signature, data, _pss_sha256, hashes.SHA256())
+    except InvalidSignature:
+        return False
+    return True
+
+
+VERIFIERS = {
+    "ES256": _verify_es256,
+    "PS256": _verify_ps256,
+}
+
+
+def is_supported(alg):
+    return alg in VERIFIERS
+
+
+# Verify the signature of data, the key must match the algorithm
+def verify(pubkey, alg, data, signature):
+    return VERIFIERS[alg](pubkey, data, signature)
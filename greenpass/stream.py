@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+# Green Pass Parser
+# Copyright (C) 2021  Davide Berardi -- <berardi.dav@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sys
+import base64
+
+from greenpass.output import NDJSONOutput
+
+
+# JSON compatible verdict of a verification
+def get_verdict(valid, cert=None, error=None):
+    verdict = {"valid": bool(valid)}
+    if cert is not None:
+        verdict.update(cert.get_summary())
+        if verdict["kid"] is not None:
+            verdict["kid"] = base64.b64encode(verdict["kid"]).decode()
+    if error is not None:
+        verdict["error"] = error
+    return verdict
+
+
+# Verify one qrcode content per line, keeping settings and keys loaded,
+# and write one verdict per line, by default as JSON (NDJSON).
+class StreamVerifier(object):
+    def __init__(self, sm, logic, cup, enable_blocklist=True,
+                 out=sys.stdout, record_output=None):
+        """Continuous verification of a stream of certificates."""
+        self.sm = sm
+        self.logic = logic
+        self.cup = cup
+        self.enable_blocklist = enable_blocklist
+        self.out = out
+        if record_output is None:
+            record_output = NDJSONOutput(out)
+        self.record_output = record_output
+
+    def verify_line(self, line):
+        try:
+            valid, cert = self.logic.verify_data(
+                line, self.sm, self.cup, self.enable_blocklist
+            )
+        # The API modules exit on errors, report it as a verdict
+        except (Exception, SystemExit) as e:
+            return get_verdict(False, error=repr(e))
+        return get_verdict(valid, cert)
+
+    # Process the lines of infile (binary) until the end of the stream.
+    # Each verdict is flushed as soon as it is ready, the output never
+    # buffers more than one line.  Return the number of valid lines.
+    def run(self, infile):
+        valid = 0
+        for lineno, line in enumerate(infile, 1):
+            line = line.strip()
+            if len(line) == 0:
+                continue
+
+            verdict = self.verify_line(line)
+            verdict["line"] = lineno
+            valid += verdict["valid"]
+
+            self.record_output.write(verdict)
+        self.record_output.close()
+        return valid
@@ -0,0 +1,520 @@
+#!/usr/bin/env python3
+
+# Green Pass Parser
+# Copyright (C) 2021  Davide Berardi -- <berardi.dav@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Generate synthetic certificates, signed with local keys, to load test
+# the verification.  The keys are exported as certificates usable with
+# --key and as a trust store for the stand-in server:
+#   python3 -m greenpass.synthetic --count 1000 --outdir /tmp/synthetic
+#   tests/standin-server.py --root /tmp/synthetic/api --port 8080 &
+#   GREENPASS_URL_DGC=http://127.0.0.1:8080/v1/dgc/ \
+#   GREENPASS_URL_DGCG=http://127.0.0.1:8080/dgcg \
+#   GREENPASS_URL_NHS=http://127.0.0.1:8080/nhs/ \
+#       ./greenpass.py --txt /tmp/synthetic/certificates.txt --stream
+
+import os
+import sys
+import json
+import zlib
+import base64
+import random
+import hashlib
+import argparse
+import datetime
+
+from greenpass import b45
+from greenpass.data import GreenPassKeyManager
+
+CERTIFICATE_TYPES = ("vaccine", "test", "recovery")
+
+# Vaccines and tests used in the payloads, with their validity in the
+# generated settings (days for vaccines, hours for tests)
+VACCINES = {
+    "EU/1/20/1528": ("ORG-100030215", 2),
+    "EU/1/20/1507": ("ORG-100031184", 2),
+    "EU/1/21/1529": ("ORG-100001699", 2),
+    "EU/1/20/1525": ("ORG-100001417", 1),
+}
+VACCINE_DAYS = (0, 270)
+TEST_TYPES = {
+    "LP6464-4":   "molecular",
+    "LP217198-3": "rapid",
+}
+TEST_HOURS = {
+    "molecular": (0, 72),
+    "rapid":     (0, 48),
+}
+RECOVERY_DAYS = (0, 180)
+# Not detected
+TEST_RESULT_NEGATIVE = "260415000"
+
+
+# Signer with a locally generated key and self-signed certificate
+class SyntheticSigner(object):
+    def __init__(self, alg="ES256", name="greenpass synthetic"):
+        """Generate a signer key for alg (ES256 or PS256)."""
+        from cryptography import x509
+        from cryptography.x509.oid import NameOID
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+        if alg == "ES256":
+            self.private_key = ec.generate_private_key(ec.SECP256R1())
+        elif alg == "PS256":
+            self.private_key = rsa.generate_private_key(65537, 2048)
+        else:
+            print("[-] Unknown algorithm: {}".format(alg))
+            sys.exit(1)
+        self.alg = alg
+
+        subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, name)])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        certificate = x509.CertificateBuilder() \
+            .subject_name(subject) \
+            .issuer_name(subject) \
+            .public_key(self.private_key.public_key()) \
+            .serial_number(x509.random_serial_number()) \
+            .not_valid_before(now - datetime.timedelta(days=1)) \
+            .not_valid_after(now + datetime.timedelta(days=3650)) \
+            .sign(self.private_key, hashes.SHA256())
+
+        self.certificate = certificate.public_bytes(
+            serialization.Encoding.DER
+        )
+        self.public_key = certificate.public_key().public_bytes(
+            serialization.Encoding.DER,
+            serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        # Same derivation of the DGC key identifiers
+        self.kid = hashlib.sha256(self.certificate).digest()[:8]
+        self.cose_key = self._get_cose_key()
+
+    def _get_cose_key(self):
+        from cose.keys import CoseKey
+
+        def b(i, size=None):
+            return i.to_bytes(size or (i.bit_length() + 7) // 8, "big")
+
+        n = self.private_key.private_numbers()
+        if self.alg == "ES256":
+            return CoseKey.from_dict({
+                "KTY":   "EC2",
+                "CURVE": "P_256",
+                "ALG":   "ES256",
+                "D":     b(n.private_value, 32),
+                "X":     b(n.public_numbers.x, 32),
+                "Y":     b(n.public_numbers.y, 32),
+            })
+        return CoseKey.from_dict({
+            "KTY":  "RSA",
+            "ALG":  "PS256",
+            "N":    b(n.public_numbers.n),
+            "E":    b(n.public_numbers.e),
+            "D":    b(n.d),
+            "P":    b(n.p),
+            "Q":    b(n.q),
+            "DP":   b(n.dmp1),
+            "DQ":   b(n.dmq1),
+            "QINV": b(n.iqmp),
+        })
+
+    # Sign the CBOR payload, return the content of the qrcode
+    def sign(self, payload):
+        from cose.messages import Sign1Message
+        from cose.headers import Algorithm, KID
+        from cose.algorithms import Es256, Ps256
+
+        alg = Es256 if self.alg == "ES256" else Ps256
+        msg = Sign1Message(phdr={Algorithm: alg, KID: self.kid},
+                           payload=payload)
+        msg.key = self.cose_key
+        return b"HC1:" + b45.b45encode(zlib.compress(msg.encode(), 9))
+
+    def get_kid_b64(self):
+        return base64.b64encode(self.kid).decode()
+
+
+class SyntheticCertificate(object):
+    def __init__(self, data, certificate_type, certificate_id, signer,
+                 expired=False, blocklisted=False):
+        """Generated certificate and its expected verification result."""
+        self.data = data
+        self.certificate_type = certificate_type
+        self.certificate_id = certificate_id
+        self.signer = signer
+        self.expired = expired
+        self.blocklisted = blocklisted
+
+    def is_valid(self):
+        return not self.expired and not self.blocklisted
+
+    def get_summary(self):
+        return {
+            "type":           self.certificate_type,
+            "certificate_id": self.certificate_id,
+            "kid":            self.signer.get_kid_b64(),
+            "sign_alg":       self.signer.alg,
+            "expired":        self.expired,
+            "blocklisted":    self.blocklisted,
+            "valid":          self.is_valid(),
+        }
+
+
+# Generate certificates with a configurable mix of types, signers,
+# expired and blocklisted certificates.  The dates are relative to
+# at_date, the certificates are valid with the settings of
+# get_settings() at that date unless expired or blocklisted.
+class SyntheticGenerator(object):
+    def __init__(self, signers, mix=None, expired=0.0, blocklisted=0.0,
+                 country="IT", at_date=None, seed=None):
+        """Synthetic certificates generator."""
+        if mix is None:
+            mix = {"vaccine": 1, "test": 1, "recovery": 1}
+        self.signers = list(signers)
+        self.mix = mix
+        self.expired = expired
+        self.blocklisted = blocklisted
+        self.country = country
+        self.at_date = at_date or datetime.datetime.now(
+            datetime.timezone.utc
+        )
+        self.random = random.Random(seed)
+        self.blocklist = []
+        self.serial = 0
+        self.k = GreenPassKeyManager().get_default()
+
+    def _days_ago(self, days):
+        return self.at_date - datetime.timedelta(days=days)
+
+    def _uvci(self):
+        self.serial += 1
+        return "URN:UVCI:01:{}:SYNTHETIC{:08d}#{}".format(
+            self.country, self.serial, self.random.randint(0, 9)
+        )
+
+    def _common(self, uvci):
+        k = self.k
+        return {
+            k.get_target_disease()[0]:      "840539006",
+            k.get_vaccination_country()[0]: self.country,
+            k.get_certificate_issuer()[0]:  "Synthetic issuer",
+            k.get_certificate_id()[0]:      uvci,
+        }
+
+    def make_vaccine(self, uvci, expired):
+        k = self.k
+        mp = self.random.choice(sorted(VACCINES))
+        manufacturer, doses = VACCINES[mp]
+        if expired:
+            days = self.random.randint(VACCINE_DAYS[1] + 1, 600)
+        else:
+            days = self.random.randint(VACCINE_DAYS[0] + 1,
+                                       VACCINE_DAYS[1] - 1)
+        entry = self._common(uvci)
+        entry.update({
+            k.get_vaccine_pn()[0]:       mp,
+            k.get_manufacturer()[0]:     manufacturer,
+            k.get_vaccine_type()[0]:     "J07BX03",
+            k.get_dose_number()[0]:      doses,
+            k.get_total_doses()[0]:      doses,
+            k.get_vaccination_date()[0]: self._days_ago(days).strftime(
+                "%Y-%m-%d"
+            ),
+        })
+        return k.get_vaccine()[0], entry
+
+    def make_test(self, uvci, expired):
+        k = self.k
+        tt = self.random.choice(sorted(TEST_TYPES))
+        end_hours = TEST_HOURS[TEST_TYPES[tt]][1]
+        if expired:
+            hours = self.random.randint(end_hours + 1, end_hours * 4)
+        else:
+            hours = self.random.randint(1, end_hours - 1)
+        collection = self.at_date - datetime.timedelta(hours=hours)
+        entry = self._common(uvci)
+        entry.update({
+            k.get_test_type()[0]:         tt,
+            k.get_test_name()[0]:         "Synthetic test",
+            k.get_date_of_collection()[0]: collection.strftime(
+                "%Y-%m-%dT%H:%M:%S+00:00"
+            ),
+            k.get_test_result()[0]:       TEST_RESULT_NEGATIVE,
+            k.get_testing_center()[0]:    "Synthetic testing center",
+        })
+        return k.get_test()[0], entry
+
+    def make_recovery(self, uvci, expired):
+        k = self.k
+        if expired:
+            days = self.random.randint(RECOVERY_DAYS[1] + 1, 600)
+        else:
+            days = self.random.randint(RECOVERY_DAYS[0] + 1,
+                                       RECOVERY_DAYS[1] - 1)
+        entry = self._common(uvci)
+        entry.update({
+            k.get_first_positive_test()[0]: self._days_ago(
+                days + 11
+            ).strftime("%Y-%m-%d"),
+            k.get_validity_from()[0]:       self._days_ago(days).strftime(
+                "%Y-%m-%d"
+            ),
+            k.get_validity_until()[0]:      self._days_ago(
+                days - RECOVERY_DAYS[1]
+            ).strftime("%Y-%m-%d"),
+        })
+        return k.get_recovery()[0], entry
+
+    # CBOR payload with the layout of GreenPassKeyManager
+    def make_payload(self, certificate_type, uvci, expired=False):
+        import cbor2
+
+        k = self.k
+        make = {
+            "vaccine":  self.make_vaccine,
+            "test":     self.make_test,
+            "recovery": self.make_recovery,
+        }[certificate_type]
+        key, entry = make(uvci, expired)
+
+        issued = int(self.at_date.timestamp()) - 24 * 60 * 60
+        family_name = self.random.choice(("ROSSI", "MUSTER", "SMITH"))
+        return cbor2.dumps({
+            k.get_release_country()[0]:   self.country,
+            k.get_release_date()[0]:      issued,
+            k.get_expiration_date()[0]:   issued + 365 * 24 * 60 * 60,
+            k.get_personal_data()[0]: {
+                k.get_personal_info()[0]: {
+                    key:                        [entry],
+                    k.get_date_of_birth()[0]:   "1970-01-01",
+                    k.get_name()[0]: {
+                        k.get_last_name()[0]:   family_name,
+                        k.get_first_name()[0]:  "SYNTHETIC",
+                        "fnt":                  family_name,
+                        "gnt":                  "SYNTHETIC",
+                    },
+                    k.get_version()[0]:         "1.3.0",
+                }
+            }
+        })
+
+    def generate_one(self):
+        types = [t for t in CERTIFICATE_TYPES if self.mix.get(t, 0) > 0]
+        certificate_type = self.random.choices(
+            types, weights=[self.mix[t] for t in types]
+        )[0]
+        signer = self.random.choice(self.signers)
+        expired = self.random.random() < self.expired
+        blocklisted = self.random.random() < self.blocklisted
+
+        uvci = self._uvci()
+        if blocklisted:
+            self.blocklist.append(uvci)
+        payload = self.make_payload(certificate_type, uvci, expired)
+        return SyntheticCertificate(signer.sign(payload), certificate_type,
+                                    uvci, signer, expired, blocklisted)
+
+    def generate(self, count):
+        for _ in range(count):
+            yield self.generate_one()
+
+    # Settings in the format of the DGC endpoint, with the validity
+    # periods used by the generator and the blocklisted UVCIs
+    def get_settings(self):
+        settings = []
+        for mp in sorted(VACCINES):
+            for full in ("complete", "not_complete"):
+                for day, value in zip(("start_day", "end_day"),
+                                      VACCINE_DAYS):
+                    settings.append({
+                        "name":  "vaccine_{}_{}".format(day, full),
+                        "type":  mp,
+                        "value": str(value),
+                    })
+        for ttype, hours in sorted(TEST_HOURS.items()):
+            for hour, value in zip(("start_hours", "end_hours"), hours):
+                settings.append({
+                    "name":  "{}_test_{}".format(ttype, hour),
+                    "type":  "GENERIC",
+                    "value": str(value),
+                })
+        for suffix in ("", "_IT", "_NOT_IT"):
+            for day, value in zip(("start_day", "end_day"), RECOVERY_DAYS):
+                settings.append({
+                    "name":  "recovery_cert_{}{}".format(day, suffix),
+                    "type":  "GENERIC",
+                    "value": str(value),
+                })
+        settings.append({
+            "name":  "black_list_uvci",
+            "type":  "black_list_uvci",
+            "value": "".join(uvci + ";" for uvci in self.blocklist),
+        })
+        return settings
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    mode = "wb" if isinstance(data, bytes) else "w"
+    with open(path, mode) as f:
+        f.write(data)
+
+
+# Export the signers and the settings as the documents of the remote
+# endpoints, laid out to be served by tests/standin-server.py:
+#   v1/dgc/settings, v1/dgc/signercertificate/status, dgcg (trust list)
+#   and nhs/pubkeys/keys.json
+def write_trust_store(root, signers, settings):
+    _write(os.path.join(root, "v1", "dgc", "settings"), json.dumps(settings))
+    _write(os.path.join(root, "v1", "dgc", "signercertificate", "status"),
+           json.dumps([s.get_kid_b64() for s in signers]))
+
+    trust_list = {"dsc_trust_list": {"IT": {"keys": [{
+        "kid": s.get_kid_b64(),
+        "x5c": [base64.b64encode(s.certificate).decode()],
+    } for s in signers]}}}
+    _write(os.path.join(root, "dgcg"),
+           "<html><body><code id=\"trust-list-json\">{}</code>"
+           "</body></html>".format(json.dumps(trust_list)))
+
+    _write(os.path.join(root, "nhs", "pubkeys", "keys.json"), json.dumps([{
+        "kid":       s.get_kid_b64(),
+        "publicKey": base64.b64encode(s.public_key).decode(),
+    } for s in signers]))
+
+
+# Certificates of the signers, one per kid, usable with --key
+def write_keys(directory, signers):
+    for s in signers:
+        # A leading dot would hide the file
+        name = s.get_kid_b64().replace("/", "_")
+        _write(os.path.join(directory, name + ".der"), s.certificate)
+
+
+def get_qrcode_image(data):
+    try:
+        import qrcode
+    except ImportError:
+        print("[-] Install qrcode to generate images")
+        sys.exit(1)
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_Q)
+    qr.add_data(data)
+    return qr.make_image().get_image()
+
+
+def write_png(path, data):
+    get_qrcode_image(data).save(path, "PNG")
+
+
+def write_pdf(path, data):
+    import io
+    import fitz
+
+    png = io.BytesIO()
+    get_qrcode_image(data).save(png, "PNG")
+
+    pdf = fitz.open()
+    page = pdf.new_page()
+    page.insert_image(fitz.Rect(150, 150, 450, 450), stream=png.getvalue())
+    pdf.save(path)
+
+
+def parse_mix(mix):
+    out = {}
+    for el in mix.split(","):
+        name, _, weight = el.partition("=")
+        if name not in CERTIFICATE_TYPES:
+            print("[-] Unknown certificate type: {}".format(name))
+            sys.exit(1)
+        out[name] = float(weight or 1)
+    return out
+
+
+def setup_argparse():
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic signed certificates"
+    )
+    parser.add_argument("--outdir", required=True,
+                        help="Output directory")
+    parser.add_argument("--count", type=int, default=100,
+                        help="Number of certificates, default:100")
+    parser.add_argument("--mix", default="vaccine=1,test=1,recovery=1",
+                        help="Weights of the certificate types")
+    parser.add_argument("--algs", default="ES256,PS256",
+                        help="Signature algorithms of the signers")
+    parser.add_argument("--kids", type=int, default=1,
+                        help="Number of signers for each algorithm")
+    parser.add_argument("--expired", type=float, default=0.0,
+                        help="Fraction of expired certificates")
+    parser.add_argument("--blocklisted", type=float, default=0.0,
+                        help="Fraction of blocklisted certificates")
+    parser.add_argument("--country", default="IT",
+                        help="Issuing country")
+    parser.add_argument("--seed", type=int,
+                        help="Seed of the random choices")
+    parser.add_argument("--png", action="store_true",
+                        help="Also write a qrcode image per certificate")
+    parser.add_argument("--pdf", action="store_true",
+                        help="Also write a pdf per certificate")
+    return parser.parse_args()
+
+
+def main():
+    args = setup_argparse()
+
+    signers = [
+        SyntheticSigner(alg)
+        for alg in args.algs.split(",")
+        for _ in range(args.kids)
+    ]
+    generator = SyntheticGenerator(signers, parse_mix(args.mix),
+                                   args.expired, args.blocklisted,
+                                   args.country, seed=args.seed)
+
+    for directory, enabled in (("png", args.png), ("pdf", args.pdf)):
+        if enabled:
+            os.makedirs(os.path.join(args.outdir, directory), exist_ok=True)
+    os.makedirs(args.outdir, exist_ok=True)
+    txt = open(os.path.join(args.outdir, "certificates.txt"), "wb")
+    manifest = open(os.path.join(args.outdir, "manifest.ndjson"), "w")
+    with txt, manifest:
+        for i, cert in enumerate(generator.generate(args.count), 1):
+            txt.write(cert.data + b"\n")
+            summary = cert.get_summary()
+            summary["line"] = i
+            manifest.write(json.dumps(summary) + "\n")
+
+            if args.png:
+                write_png(os.path.join(
+                    args.outdir, "png", "{:06d}.png".format(i)
+                ), cert.data)
+            if args.pdf:
+                write_pdf(os.path.join(
+                    args.outdir, "pdf", "{:06d}.pdf".format(i)
+                ), cert.data)
+
+    write_keys(os.path.join(args.outdir, "keys"), signers)
+    write_trust_store(os.path.join(args.outdir, "api"), signers,
+                      generator.get_settings())
+    print("[+] {} certificates written to {}".format(
+        args.count, args.outdir
+    ))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
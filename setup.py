@@ -59,7 +59,7 @@ setup(
         'colorama',
         'Pillow',
         'pyasn1',
-        'pyOpenSSL',
+        'cryptography',
         'pyzbar',
         'requests',
         'termcolor',
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+# Green Pass Parser
+# Copyright (C) 2021  Davide Berardi -- <berardi.dav@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Local stand-in for the remote API endpoints, serves the files in ROOT
+# with keep-alive, gzip and conditional requests (ETag and Last-Modified)
+# and counts the connections and the requests (GET /_stats).  --delay
+# simulates the latency of the remote endpoints.
+
+import os
+import sys
+import gzip
+import json
+import hashlib
+import time
+import argparse
+import posixpath
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+stats = {"connections": 0, "requests": 0, "failures": 0, "not_modified": 0}
+lock = threading.Lock()
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        """Count the accepted connections."""
+        super(StandinHandler, self).setup()
+        with lock:
+            stats["connections"] += 1
+
+    def log_message(self, *_args):
+        """Do not log the requests."""
+        pass
+
+    def send_data(self, code, data, content_type="application/json",
+                  headers=None):
+        if data and "gzip" in self.headers.get("Accept-Encoding", ""):
+            data = gzip.compress(data)
+            self.send_response(code)
+            self.send_header("Content-Encoding", "gzip")
+        else:
+            self.send_response(code)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        """Serve a file from the root directory."""
+        if self.path == "/_stats":
+            self.send_data(200, json.dumps(stats).encode())
+            return
+
+        with lock:
+            stats["requests"] += 1
+            fail = stats["failures"] < self.server.fail
+            if fail:
+                stats["failures"] += 1
+
+        if fail:
+            self.send_data(503, b"")
+            return
+
+        time.sleep(self.server.delay)
+
+        path, _, query = self.path.partition("?")
+        path = posixpath.normpath(path).lstrip("/")
+        path = os.path.join(self.server.root, path)
+        # Query parameters select PATH_KEY=VALUE_KEY=VALUE files
+        if query != "":
+            path = "{}_{}".format(path, query.replace("&", "_"))
+        if not os.path.isfile(path):
+            self.send_data(404, b"")
+            return
+
+        with open(path, "rb") as f:
+            data = f.read()
+
+        headers = {
+            "ETag": '"{}"'.format(hashlib.sha1(data).hexdigest()),
+            "Last-Modified": formatdate(os.path.getmtime(path), usegmt=True)
+        }
+        if self.headers.get("If-None-Match", None) == headers["ETag"]:
+            with lock:
+                stats["not_modified"] += 1
+            self.send_data(304, b"", headers=headers)
+            return
+
+        self.send_data(200, data, headers=headers)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", default="tests/data/api")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--port-file",
+                        help="write the listening port in PORT_FILE")
+    parser.add_argument("--fail", type=int, default=0,
+                        help="answer 503 to the first FAIL requests")
+    parser.add_argument("--delay", type=float, default=0,
+                        help="wait DELAY seconds before every answer")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), StandinHandler)
+    server.root = args.root
+    server.fail = args.fail
+    server.delay = args.delay
+    server.daemon_threads = True
+
+    port = server.server_address[1]
+    if args.port_file is not None:
+        with open(args.port_file + ".tmp", "w") as f:
+            f.write(str(port))
+        os.rename(args.port_file + ".tmp", args.port_file)
+    else:
+        print(port, flush=True)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,23 @@
+#!/bin/bash
+
+set -eu
+
+PORTFILE="/tmp/gp-standin.port"
+rm -f "$PORTFILE"
+
+# Answer 503 to the first two requests to exercise the retries
+python3 tests/standin-server.py --root tests/data/api --fail 2 \
+	--port-file "$PORTFILE" &
+SERVER="$!"
+trap 'kill "$SERVER"' EXIT
+
+while ! test -f "$PORTFILE"; do
+	sleep 0.1
+done
+BASE="http://127.0.0.1:$(cat "$PORTFILE")"
+
+export GREENPASS_URL_DGC="$BASE/v1/dgc/"
+
+assert_false "$GP" --no-cache --settings
+assert_string_out "URN:UVCI:01:IT:STANDIN#1" "$GP" --no-cache --settings
+assert_string_out "recovery+vaccine" "$GP" --no-cache --settings
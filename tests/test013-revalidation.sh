@@ -0,0 +1,44 @@
+#!/bin/bash
+
+set -eu
+
+PORTFILE="/tmp/gp-standin.port"
+CACHEDIR="/tmp/gp-cache-revalidation"
+rm -rf "$PORTFILE" "$CACHEDIR"
+
+python3 tests/standin-server.py --root tests/data/api \
+	--port-file "$PORTFILE" &
+SERVER="$!"
+trap 'kill "$SERVER"' EXIT
+
+while ! test -f "$PORTFILE"; do
+	sleep 0.1
+done
+BASE="http://127.0.0.1:$(cat "$PORTFILE")"
+
+export GREENPASS_URL_DGC="$BASE/v1/dgc/"
+
+assert_false "$GP" --cachedir "$CACHEDIR" --settings
+assert_file_exists "$CACHEDIR/settings.meta"
+
+# Fresh cache, nothing is requested
+assert_false "$GP" --cachedir "$CACHEDIR" --settings
+# Expired cache, the settings are revalidated but not downloaded again
+assert_string_out "URN:UVCI:01:IT:STANDIN#1" "$GP" --cachedir "$CACHEDIR" \
+	--max-age 0 --settings
+
+python3 -c "
+import json, sys, urllib.request
+stats = json.load(urllib.request.urlopen('$BASE/_stats'))
+sys.exit(not (stats['requests'] == 2 and stats['not_modified'] == 1))
+"
+
+# Always revalidate: the background refresher of --stream does not
+# download the settings again in a loop
+sleep 1 | "$GP" --cachedir "$CACHEDIR" --max-age 0 --stream --txt - \
+	--no-block-list > /dev/null 2>&1
+python3 -c "
+import json, sys, urllib.request
+stats = json.load(urllib.request.urlopen('$BASE/_stats'))
+sys.exit(not stats['requests'] <= 4)
+"
@@ -0,0 +1,71 @@
+#!/bin/bash
+
+set -eu
+
+PORTFILE="/tmp/gp-standin.port"
+CACHEDIR="/tmp/gp-cache-drl"
+rm -rf "$PORTFILE" "$CACHEDIR"
+
+python3 tests/standin-server.py --root tests/data/api \
+	--port-file "$PORTFILE" &
+SERVER="$!"
+trap 'kill "$SERVER"' EXIT
+
+while ! test -f "$PORTFILE"; do
+	sleep 0.1
+done
+BASE="http://127.0.0.1:$(cat "$PORTFILE")"
+
+export GREENPASS_URL_DGC="$BASE/v1/dgc/"
+
+# First synchronization, the whole list is downloaded
+assert_string_out "version *2" "$GP" --cachedir "$CACHEDIR" --drl --settings
+assert_file_exists "$CACHEDIR/drl"
+
+# Only the changes are applied
+assert_string_out "version *3" "$GP" --cachedir "$CACHEDIR" --drl \
+	--max-age 0 --settings
+assert_file_exists "$CACHEDIR/drl.journal"
+assert_string_out "revoked pass IDs *3" "$GP" --cachedir "$CACHEDIR" \
+	--drl --settings
+
+# Without a cache the whole list is downloaded
+assert_string_out "version *2" "$GP" --no-cache --drl --settings
+
+# A delta in two chunks, the second one is not available yet
+D="/tmp/gp-drl-chunks"
+PORTFILE2="/tmp/gp-standin-drl-chunks.port"
+rm -rf "$D" "$PORTFILE2"
+cp -r tests/data/api "$D"
+cat > "$D/v1/dgc/drl/check_version=3" <<'JSON'
+{"id": "standin", "fromVersion": 3, "version": 4, "chunk": 1,
+ "totalChunk": 2, "totalNumberUCVI": 5}
+JSON
+cat > "$D/v1/dgc/drl_version=3_chunk=1" <<'JSON'
+{"id": "standin", "version": 4, "chunk": 1, "lastChunk": 2,
+ "delta": {"insertions": ["4kylasmlOeCrJ+BQXp9jhvGz0DP7+z/zOwIZCD3dHuI="],
+           "deletions": []}}
+JSON
+
+python3 tests/standin-server.py --root "$D" --port-file "$PORTFILE2" &
+SERVER2="$!"
+trap 'kill "$SERVER" "$SERVER2"' EXIT
+while ! test -f "$PORTFILE2"; do
+	sleep 0.1
+done
+export GREENPASS_URL_DGC="http://127.0.0.1:$(cat "$PORTFILE2")/v1/dgc/"
+
+# The local version stays the same until the last chunk is applied
+assert_false "$GP" --cachedir "$CACHEDIR" --drl --max-age 0 --settings
+assert_string_out "version *3" "$GP" --cachedir "$CACHEDIR" --drl --settings
+
+# The next synchronization downloads both chunks
+cat > "$D/v1/dgc/drl_version=3_chunk=2" <<'JSON'
+{"id": "standin", "version": 4, "chunk": 2, "lastChunk": 2,
+ "delta": {"insertions": ["NFnWJBLtci1hsiU8NzuwrIA8hnhFrIZ/SJtZXNKzdR4="],
+           "deletions": []}}
+JSON
+assert_string_out "version *4" "$GP" --cachedir "$CACHEDIR" --drl \
+	--max-age 0 --settings
+assert_string_out "revoked pass IDs *5" "$GP" --cachedir "$CACHEDIR" \
+	--drl --settings
@@ -0,0 +1,45 @@
+#!/bin/bash
+
+set -eu
+
+S="/tmp/gp-stream"
+D="/tmp/gp-stream.txt"
+PORTFILE="/tmp/gp-standin-stream.port"
+rm -rf "$S" "$PORTFILE"
+
+# Offline certificates and trust list
+assert_true python3 -m greenpass.synthetic --outdir "$S" --count 2 \
+	--mix vaccine --seed 3
+F="$S/first.txt"
+# Without the newline, as tests/data/ah-1900.txt
+head -n 1 "$S/certificates.txt" | tr -d "\n" > "$F"
+ID="$(python3 -c 'import json, sys
+print(json.loads(sys.stdin.readline())["certificate_id"])' \
+	< "$S/manifest.ndjson")"
+
+python3 tests/standin-server.py --root "$S/api" --port-file "$PORTFILE" &
+SERVER="$!"
+trap 'kill "$SERVER"' EXIT
+
+while ! test -f "$PORTFILE"; do
+	sleep 0.1
+done
+BASE="http://127.0.0.1:$(cat "$PORTFILE")"
+export GREENPASS_URL_DGC="$BASE/v1/dgc/"
+export GREENPASS_URL_DGCG="$BASE/dgcg"
+export GREENPASS_URL_NHS="$BASE/nhs/"
+
+# Two certificates, an empty line and a broken one
+(cat "$F"; echo; echo; cat "$F"; echo; echo "HC1:BROKEN") > "$D"
+
+assert_true "$GP" --no-cache --txt "$D" --stream --no-block-list
+assert_string_out "\"certificate_id\": \"$ID\", .*\"verified\": true" \
+	"$GP" --no-cache --txt "$D" --stream --no-block-list
+assert_string_out '"valid": false, "error": .*"line": 4}' \
+	"$GP" --no-cache --txt "$D" --stream --no-block-list
+
+# One verdict per non-empty line, also from the standard input
+test "$("$GP" --no-cache --txt - --stream --no-block-list < "$D" | \
+	grep -c '"line"')" = 3
+test "$("$GP" --no-cache --txt - --stream --no-block-list < "$D" | \
+	grep -c '"verified": true')" = 2
@@ -0,0 +1,107 @@
+#!/bin/bash
+
+set -eu
+
+D="/tmp/gp-serve"
+PORTFILE="/tmp/gp-standin-serve.port"
+LOG="/tmp/gp-serve.log"
+SOCKET="/tmp/gp-serve.sock"
+rm -rf "$D" "$PORTFILE" "$LOG"
+
+# Valid certificates of both algorithms
+assert_true python3 -m greenpass.synthetic --outdir "$D" --count 8 \
+	--kids 2 --seed 4
+
+python3 tests/standin-server.py --root "$D/api" --port-file "$PORTFILE" &
+SERVER="$!"
+trap 'kill "$SERVER"' EXIT
+
+while ! test -f "$PORTFILE"; do
+	sleep 0.1
+done
+BASE="http://127.0.0.1:$(cat "$PORTFILE")"
+export GREENPASS_URL_DGC="$BASE/v1/dgc/"
+export GREENPASS_URL_DGCG="$BASE/dgcg"
+export GREENPASS_URL_NHS="$BASE/nhs/"
+
+"$GP" --serve 127.0.0.1:0 --no-cache > "$LOG" &
+DAEMON="$!"
+"$GP" --serve "unix:$SOCKET" --no-cache > /dev/null &
+UNIXDAEMON="$!"
+trap 'kill "$SERVER" "$DAEMON" "$UNIXDAEMON"' EXIT
+
+while ! grep -q "Listening on" "$LOG"; do
+	# The daemon exited without listening
+	kill -0 "$DAEMON"
+	sleep 0.1
+done
+URL="$(sed -n 's/.*Listening on //p' "$LOG")"
+
+python3 - "$URL" "$SOCKET" "$D" <<'PYTHON'
+import sys, json, time, socket, http.client, urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+url, path, d = sys.argv[1:]
+
+def post(data, content_type="text/plain"):
+    req = urllib.request.Request(url + "/verify", data=data,
+                                 headers={"Content-Type": content_type})
+    return json.load(urllib.request.urlopen(req))
+
+health = json.load(urllib.request.urlopen(url + "/health"))
+assert health["status"] == "ok", health
+
+verdict = post(b"HC1:BROKEN")
+assert verdict["valid"] is False and "error" in verdict, verdict
+verdict = post(b"not a png", "image/png")
+assert verdict["valid"] is False and "error" in verdict, verdict
+
+# Malformed or negative lengths are refused
+host, port = url[len("http://"):].split(":")
+for length in ("abc", "-1"):
+    conn = http.client.HTTPConnection(host, int(port))
+    conn.putrequest("POST", "/verify")
+    conn.putheader("Content-Length", length)
+    conn.endheaders()
+    assert conn.getresponse().status == 400
+    conn.close()
+
+metrics = urllib.request.urlopen(url + "/metrics").read().decode()
+assert "greenpass_daemon_requests_total 2" in metrics, metrics
+assert "greenpass_daemon_errors_total 2" in metrics, metrics
+# Stage timers and the settings downloaded at startup
+assert "greenpass_input_png_seconds_count 1" in metrics, metrics
+assert "greenpass_http_requests_total" in metrics, metrics
+
+# Valid certificates, also verified by concurrent requests
+with open(d + "/manifest.ndjson") as f:
+    expected = [json.loads(line) for line in f]
+with open(d + "/certificates.txt", "rb") as f:
+    lines = [line.strip() for line in f]
+
+verdict = post(lines[0])
+assert verdict["valid"] is True and verdict["verified"] is True, verdict
+assert verdict["certificate_id"] == expected[0]["certificate_id"], verdict
+
+with ThreadPoolExecutor(max_workers=8) as ex:
+    verdicts = list(ex.map(post, lines * 4))
+for e, v in zip(expected * 4, verdicts):
+    assert v["verified"] is True, v
+    assert v["valid"] == e["valid"], (e, v)
+    assert v["certificate_id"] == e["certificate_id"], (e, v)
+
+# Same endpoints on the Unix socket
+class UnixConnection(http.client.HTTPConnection):
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+
+for _ in range(100):
+    try:
+        conn = UnixConnection("localhost")
+        conn.request("GET", "/health")
+        break
+    except OSError:
+        time.sleep(0.1)
+assert json.load(conn.getresponse())["status"] == "ok"
+PYTHON
@@ -0,0 +1,141 @@
+#!/bin/bash
+
+set -eu
+
+D="/tmp/gp-synthetic"
+PORTFILE="/tmp/gp-standin-synthetic.port"
+rm -rf "$D" "$PORTFILE"
+
+# Both algorithms, two signers each, expired and blocklisted certificates
+assert_true python3 -m greenpass.synthetic --outdir "$D" --count 30 \
+	--kids 2 --expired 0.2 --blocklisted 0.2 --seed 1
+assert_file_exists "$D/certificates.txt"
+assert_file_exists "$D/api/nhs/pubkeys/keys.json"
+
+# A single signer can be used as fixed key
+KEY="$(ls "$D"/keys/*.der | head -n 1)"
+test "$(ls "$D"/keys/*.der | wc -l)" = 4
+
+python3 tests/standin-server.py --root "$D/api" --port-file "$PORTFILE" &
+SERVER="$!"
+trap 'kill "$SERVER"' EXIT
+
+while ! test -f "$PORTFILE"; do
+	sleep 0.1
+done
+BASE="http://127.0.0.1:$(cat "$PORTFILE")"
+export GREENPASS_URL_DGC="$BASE/v1/dgc/"
+export GREENPASS_URL_DGCG="$BASE/dgcg"
+export GREENPASS_URL_NHS="$BASE/nhs/"
+
+# The verdicts match the expected results of the generator
+"$GP" --no-cache --txt "$D/certificates.txt" --stream > "$D/verdicts.ndjson"
+python3 - "$D" <<'PYTHON'
+import sys, json
+
+d = sys.argv[1]
+with open(d + "/manifest.ndjson") as f:
+    expected = [json.loads(line) for line in f]
+with open(d + "/verdicts.ndjson") as f:
+    verdicts = [json.loads(line) for line in f]
+
+assert len(expected) == len(verdicts) == 30
+assert any(e["valid"] for e in expected)
+assert any(e["expired"] for e in expected)
+assert any(e["blocklisted"] for e in expected)
+for e, v in zip(expected, verdicts):
+    assert v["verified"], v
+    for key in ("valid", "expired", "blocklisted", "type", "kid",
+                "certificate_id"):
+        assert e[key] == v[key], (e, v)
+PYTHON
+
+assert_string_out '"verified": true' \
+	"$GP" --no-cache --txt "$D/certificates.txt" --stream --key "$KEY"
+
+# Structured output formats
+"$GP" --no-cache --txt "$D/certificates.txt" --stream --format csv \
+	> "$D/verdicts.csv"
+test "$(head -n 1 "$D/verdicts.csv" | cut -d , -f 1-3)" = "line,valid,type"
+test "$(wc -l < "$D/verdicts.csv")" = 31
+head -n 1 "$D/certificates.txt" > "$D/first.txt"
+assert_string_out '"certificate_id": "URN:UVCI:01:IT:SYNTHETIC00000001' \
+	"$GP" --no-cache --txt "$D/first.txt" --format json
+
+# A key of the other algorithm does not verify the signature
+RSAKEY="$(python3 - "$D" <<'PYTHON'
+import sys, json
+
+d = sys.argv[1]
+with open(d + "/manifest.ndjson") as f:
+    expected = [json.loads(line) for line in f]
+first = expected[0]["sign_alg"]
+for e in expected:
+    if e["sign_alg"] != first:
+        print("{}/keys/{}.der".format(d, e["kid"].replace("/", "_")))
+        break
+PYTHON
+)"
+assert_string_out '"verified": false' \
+	"$GP" --no-cache --txt "$D/first.txt" --stream --key "$RSAKEY"
+
+# The batch verifier resolves the keys of a chunk together
+mkdir -p "$D/cache"
+python3 - "$D" <<'PYTHON'
+import sys, json
+
+from greenpass.batch import BatchVerifier
+
+d = sys.argv[1]
+with open(d + "/manifest.ndjson") as f:
+    expected = [json.loads(line) for line in f]
+with open(d + "/certificates.txt", "rb") as f:
+    items = [line.strip() for line in f] + [b"HC1:invalid"]
+
+with BatchVerifier(d + "/cache", workers=2, chunk_size=7) as bv:
+    results = bv.verify_all(items)
+
+assert [r.index for r in results] == list(range(31))
+assert results[-1].error is not None and not results[-1].valid
+for e, r in zip(expected, results):
+    assert r.error is None, r.error
+    assert e["valid"] == r.valid, (e, r)
+PYTHON
+
+# Scanned again, the cached certificates are not verified again
+cat "$D/certificates.txt" "$D/certificates.txt" > "$D/twice.txt"
+"$GP" --no-cache --txt "$D/twice.txt" --stream --cache-results 600 \
+	--profile "$D/cached.trace" > "$D/cached.ndjson"
+python3 - "$D" <<'PYTHON'
+import sys, json
+
+d = sys.argv[1]
+with open(d + "/cached.ndjson") as f:
+    verdicts = [json.loads(line) for line in f]
+with open(d + "/cached.trace") as f:
+    events = json.load(f)["traceEvents"]
+
+assert len(verdicts) == 60
+for first, again in zip(verdicts[:30], verdicts[30:]):
+    for v in (first, again):
+        for key in ("line", "hours_to_valid", "remaining_hours"):
+            v.pop(key)
+    assert first == again, (first, again)
+signatures = [e for e in events if e["name"] == "verify.signature"]
+assert len(signatures) == 30, len(signatures)
+PYTHON
+
+# The cached keys have the same permissions as the cached settings
+assert_string_out '"verified": true' \
+	"$GP" --cachedir "$D/cache" --txt "$D/first.txt" --stream
+python3 - "$D/cache" <<'PYTHON'
+import os, sys, stat
+
+cachedir = sys.argv[1]
+mode = stat.S_IMODE(os.stat(os.path.join(cachedir, "settings")).st_mode)
+keys = [name for name in os.listdir(cachedir) if name.endswith("=")]
+assert keys
+for name in keys:
+    path = os.path.join(cachedir, name)
+    assert stat.S_IMODE(os.stat(path).st_mode) == mode, (path, mode)
+PYTHON
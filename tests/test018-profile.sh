@@ -0,0 +1,35 @@
+#!/bin/bash
+
+set -eu
+
+PORTFILE="/tmp/gp-standin-profile.port"
+TRACE="/tmp/gp-profile.json"
+CPROFILE="/tmp/gp-cprofile.txt"
+rm -f "$PORTFILE" "$TRACE" "$CPROFILE"
+
+python3 tests/standin-server.py --root tests/data/api \
+	--port-file "$PORTFILE" &
+SERVER="$!"
+trap 'kill "$SERVER"' EXIT
+
+while ! test -f "$PORTFILE"; do
+	sleep 0.1
+done
+export GREENPASS_URL_DGC="http://127.0.0.1:$(cat "$PORTFILE")/v1/dgc/"
+
+assert_false "$GP" --no-cache --txt tests/data/ah-1900.txt --raw \
+	--profile "$TRACE" --cprofile "$CPROFILE"
+assert_file_exists "$TRACE"
+assert_string_out "Ordered by: cumulative time" cat "$CPROFILE"
+
+python3 - "$TRACE" <<'PYTHON'
+import sys, json
+
+with open(sys.argv[1]) as f:
+    events = json.load(f)["traceEvents"]
+names = set(e["name"] for e in events)
+for name in ("imports", "args", "settings.load", "http.get", "input.txt",
+             "parse", "parse.cose"):
+    assert name in names, (name, names)
+assert all(e["ph"] == "X" and e["dur"] >= 0 for e in events)
+PYTHON
@@ -0,0 +1,33 @@
+#!/bin/bash
+
+set -eu
+
+D="/tmp/gp-fanout"
+PORTFILE="/tmp/gp-standin-fanout.port"
+rm -rf "$D" "$PORTFILE"
+
+assert_true python3 -m greenpass.synthetic --outdir "$D" --count 1 \
+	--mix vaccine --seed 1
+# The kid can only be found in the DGC source
+echo "[]" > "$D/api/nhs/pubkeys/keys.json"
+
+# Every answer takes 2 seconds: the three key documents are downloaded
+# at the same time, in sequence they would take 6 seconds
+python3 tests/standin-server.py --root "$D/api" --delay 2 \
+	--port-file "$PORTFILE" &
+SERVER="$!"
+trap 'kill "$SERVER"' EXIT
+
+while ! test -f "$PORTFILE"; do
+	sleep 0.1
+done
+BASE="http://127.0.0.1:$(cat "$PORTFILE")"
+export GREENPASS_URL_DGC="$BASE/v1/dgc/"
+export GREENPASS_URL_DGCG="$BASE/dgcg"
+export GREENPASS_URL_NHS="$BASE/nhs/"
+
+START="$(date +%s)"
+assert_string_out '"verified": true' \
+	"$GP" --no-cache --txt "$D/certificates.txt" --stream
+# Settings and keys, with some margin for the startup
+test "$(( $(date +%s) - START ))" -lt 7
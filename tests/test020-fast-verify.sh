@@ -0,0 +1,104 @@
+#!/bin/bash
+
+set -eu
+
+D="/tmp/gp-fast-verify"
+PORTFILE="/tmp/gp-standin-fast-verify.port"
+rm -rf "$D" "$PORTFILE"
+
+assert_true python3 -m greenpass.synthetic --outdir "$D" --count 20 \
+	--kids 2 --expired 0.2 --blocklisted 0.2 --seed 2
+
+# The same certificates with a bit of the signature flipped
+python3 - "$D" <<'PYTHON'
+import sys, zlib
+
+import cbor2
+
+from greenpass import b45
+
+d = sys.argv[1]
+with open(d + "/certificates.txt", "rb") as f:
+    lines = [line.strip() for line in f]
+
+with open(d + "/tampered.txt", "wb") as f:
+    for i, line in enumerate(lines):
+        tag = cbor2.loads(zlib.decompress(b45.b45decode(line[4:])))
+        signature = bytearray(tag.value[3])
+        signature[i % len(signature)] ^= 1 << (i % 8)
+        tag.value[3] = bytes(signature)
+        data = b45.b45encode(zlib.compress(cbor2.dumps(tag)))
+        f.write(b"HC1:" + data + b"\n")
+PYTHON
+cat "$D/certificates.txt" "$D/tampered.txt" > "$D/all.txt"
+
+python3 tests/standin-server.py --root "$D/api" --port-file "$PORTFILE" &
+SERVER="$!"
+trap 'kill "$SERVER"' EXIT
+
+while ! test -f "$PORTFILE"; do
+	sleep 0.1
+done
+BASE="http://127.0.0.1:$(cat "$PORTFILE")"
+export GREENPASS_URL_DGC="$BASE/v1/dgc/"
+export GREENPASS_URL_DGCG="$BASE/dgcg"
+export GREENPASS_URL_NHS="$BASE/nhs/"
+
+# Both verifiers give the same verdicts
+"$GP" --no-cache --txt "$D/all.txt" --stream > "$D/cose.ndjson"
+"$GP" --no-cache --txt "$D/all.txt" --stream --fast-verify \
+	> "$D/fast.ndjson"
+python3 - "$D" <<'PYTHON'
+import sys, json
+
+d = sys.argv[1]
+with open(d + "/cose.ndjson") as f:
+    cose = [json.loads(line) for line in f]
+with open(d + "/fast.ndjson") as f:
+    fast = [json.loads(line) for line in f]
+
+assert len(cose) == len(fast) == 40
+assert all(v["verified"] for v in cose[:20])
+assert not any(v["verified"] for v in cose[20:])
+# The remaining hours depend on the time of the run
+for c, v in zip(cose, fast):
+    for key in ("hours_to_valid", "remaining_hours"):
+        c.pop(key, None)
+        v.pop(key, None)
+    assert c == v, (c, v)
+PYTHON
+
+# Same for a single certificate with a fixed key of the other signer
+head -n 1 "$D/certificates.txt" > "$D/first.txt"
+for KEY in "$D"/keys/*.der; do
+	"$GP" --no-cache --txt "$D/first.txt" --key "$KEY" --stream \
+		| grep -o '"verified": [a-z]*' >> "$D/cose.txt"
+	"$GP" --no-cache --txt "$D/first.txt" --key "$KEY" --stream \
+		--fast-verify | grep -o '"verified": [a-z]*' >> "$D/fast.txt"
+done
+grep -q '"verified": false' "$D/cose.txt"
+cmp "$D/cose.txt" "$D/fast.txt"
+
+# The verifier of the LogicManager is used by every entry point
+python3 - "$D" <<'PYTHON'
+import sys
+
+from greenpass.api import get_certificate_updater
+from greenpass.logic import GreenPassParser, LogicManager
+from greenpass.settings import SettingsManager
+
+d = sys.argv[1]
+with open(d + "/first.txt", "rb") as f:
+    data = f.read().strip()
+
+def get_key_coseobj(*_args, **_kwargs):
+    raise AssertionError("COSE key requested with fast_verify")
+
+cup = get_certificate_updater()
+cup.get_key_coseobj = get_key_coseobj
+cert = GreenPassParser(data).get_certificate()
+LogicManager("", fast_verify=True).verify_certificate(
+    cert, SettingsManager(), cup, enable_blocklist=False
+)
+assert cert.get_verified()
+PYTHON
@@ -0,0 +1,88 @@
+#!/bin/bash
+
+set -eu
+
+D="/tmp/gp-revoked"
+PORTFILE="/tmp/gp-standin-revoked.port"
+rm -rf "$D" "$PORTFILE"
+
+assert_true python3 -m greenpass.synthetic --outdir "$D" --count 4 \
+	--kids 2 --mix vaccine --seed 5
+
+python3 tests/standin-server.py --root "$D/api" --port-file "$PORTFILE" &
+SERVER="$!"
+trap 'kill "$SERVER"' EXIT
+
+while ! test -f "$PORTFILE"; do
+	sleep 0.1
+done
+BASE="http://127.0.0.1:$(cat "$PORTFILE")"
+export GREENPASS_URL_DGC="$BASE/v1/dgc/"
+export GREENPASS_URL_DGCG="$BASE/dgcg"
+export GREENPASS_URL_NHS="$BASE/nhs/"
+
+# A signer removed from the trust lists does not verify the certificates
+# scanned again after the refresh, whichever cache kept its key or the
+# verified result
+python3 - "$D" <<'PYTHON'
+import sys, json, shutil
+
+from greenpass.api import get_certificate_updater
+from greenpass.logic import LogicManager
+from greenpass.settings import SettingsManager
+from greenpass.stream import StreamVerifier
+
+d = sys.argv[1]
+with open(d + "/manifest.ndjson") as f:
+    expected = [json.loads(line) for line in f]
+with open(d + "/certificates.txt", "rb") as f:
+    lines = [line.strip() for line in f]
+
+revoked = expected[0]["kid"]
+other = [i for i, e in enumerate(expected) if e["kid"] != revoked][0]
+
+keys = d + "/api/nhs/pubkeys/keys.json"
+status = d + "/api/v1/dgc/signercertificate/status"
+for path in (keys, status):
+    shutil.copy(path, path + ".orig")
+
+def revoke(kid):
+    with open(keys + ".orig") as f:
+        nhs = [x for x in json.load(f) if x["kid"] != kid]
+    with open(keys, "w") as f:
+        json.dump(nhs, f)
+    with open(status + ".orig") as f:
+        dgc = [x for x in json.load(f) if x != kid]
+    with open(status, "w") as f:
+        json.dump(dgc, f)
+
+def restore():
+    for path in (keys, status):
+        shutil.copy(path + ".orig", path)
+
+sm = SettingsManager()
+# Cache directory, result cache, fast verification
+for cachedir, ttl, fast in (("", None, False), ("", 600, False),
+                            ("", 600, True), (d + "/cache", None, False),
+                            (d + "/cache", 600, True)):
+    restore()
+    shutil.rmtree(d + "/cache", ignore_errors=True)
+    cup = get_certificate_updater(cachedir)
+    sv = StreamVerifier(sm, LogicManager(cachedir, fast, ttl), cup,
+                        enable_blocklist=False)
+    for line in (lines[0], lines[other]):
+        verdict = sv.verify_line(line)
+        assert verdict["verified"] is True, verdict
+    # The sources not used by the lookups are downloaded in background
+    cup.trust_store.load()
+
+    revoke(revoked)
+    cup.trust_store.refresh()
+
+    verdict = sv.verify_line(lines[0])
+    assert verdict["valid"] is False, (cachedir, ttl, fast, verdict)
+    assert not verdict.get("verified", False), (cachedir, ttl, fast, verdict)
+    # The other signers are still trusted
+    verdict = sv.verify_line(lines[other])
+    assert verdict["verified"] is True, (cachedir, ttl, fast, verdict)
+PYTHON
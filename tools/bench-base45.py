@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+# Green Pass Parser
+# Copyright (C) 2021  Davide Berardi -- <berardi.dav@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Compare the single pass base45 decoder with the previous three pass
+# validation and decoding of GreenPassParser.
+
+import os
+import sys
+import timeit
+import argparse
+
+import base45
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from greenpass import b45  # noqa: E402
+
+
+def three_pass(certification):
+    unstripped_data = b":".join(certification.split(b":")[1::])
+    data = b":".join(certification.strip().split(b":")[1::])
+
+    s = unstripped_data.decode()
+    not_completely_base45 = not all(c in base45.BASE45_CHARSET for c in s)
+    not_base45_chars = set()
+    for c in s:
+        if c not in base45.BASE45_CHARSET:
+            not_base45_chars.add(c)
+
+    return base45.b45decode(data), not_completely_base45, not_base45_chars
+
+
+def single_pass(certification):
+    prefix = certification.find(b":")
+    decoded, invalid = b45.decode_payload(certification, prefix + 1)
+    return decoded, len(invalid) > 0, invalid
+
+
+def bench(name, fun, data, number):
+    t = min(timeit.repeat(lambda: fun(data), number=number, repeat=5))
+    print("  {:12s} {:10.2f} us/op {:12.0f} ops/s".format(
+        name, t / number * 1e6, number / t
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--txt", default="tests/data/ah-1900.txt",
+                        help="qrcode content to decode")
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    with open(args.txt, "rb") as f:
+        certification = f.read()
+
+    # Same results, trailing newline included
+    for data in (certification, certification + b"\n"):
+        assert three_pass(data) == single_pass(data)
+
+    print("Certificate ({} bytes)".format(len(certification)))
+    bench("three-pass", three_pass, certification, args.number)
+    bench("single-pass", single_pass, certification, args.number)
+
+    # Bulk input, decoded with numpy when available
+    bulk = b"HC1:" + base45.b45encode(os.urandom(64 * 1024))
+    print("Bulk ({} bytes, numpy {})".format(
+        len(bulk), "enabled" if b45.get_numpy() is not None else "disabled"
+    ))
+    bench("three-pass", three_pass, bulk, max(args.number // 100, 1))
+    bench("single-pass", single_pass, bulk, max(args.number // 100, 1))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
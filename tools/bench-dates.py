@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# Green Pass Parser
+# Copyright (C) 2021  Davide Berardi -- <berardi.dav@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Compare the date parsing of the certificates with the previous
+# implementation: the regex compiled at every call, strptime and pytz.
+
+import os
+import re
+import sys
+import timeit
+import argparse
+from datetime import datetime
+
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from greenpass import logic  # noqa: E402
+
+
+def reference_parse_timestamp(d):
+    return datetime.fromtimestamp(d, pytz.utc)
+
+
+def reference_parse_date_time(d):
+    rgx = r"""
+    (
+        \d{4}-\d{2}-\d{2}T # Date
+        \d{2}:\d{2}:\d{2}  # Time
+    )
+    (
+        [+-]
+        \d{2}              # Timezone hours
+        (?::\d{2})         # Timezone minutes
+    )?
+    """
+    compiled_regex = re.compile(rgx, re.VERBOSE)
+    r = compiled_regex.match(d)
+    date = r.group(1)
+    zone = r.group(2)
+
+    if zone is None:
+        date += "+0000"
+    else:
+        date += r.group(2).replace(":", "")
+
+    return datetime.strptime(date, "%Y-%m-%dT%H:%M:%S%z")
+
+
+def reference_parse_date(d):
+    if "T" in d:
+        return reference_parse_date_time(d)
+    d = datetime.strptime(d, "%Y-%m-%d")
+    return pytz.utc.localize(d, is_dst=None).astimezone(pytz.utc)
+
+
+# Dates of a certificate: vaccination, test collection (with and
+# without timezone, with fractions of second) and the CWT timestamps
+DATES = (
+    "2021-05-10",
+    "2021-11-10T10:00:00Z",
+    "2021-05-10T10:00:00+02:00",
+    "2021-05-10T10:00:00-0530",
+    "2021-05-10T10:00:00.123+02:00",
+)
+TIMESTAMPS = (1620640800, 1652176800)
+
+
+def reference(dates, timestamps):
+    return [reference_parse_date(d) for d in dates] + \
+        [reference_parse_timestamp(t) for t in timestamps]
+
+
+# Without the caches, as the first certificate of a batch
+def uncached(dates, timestamps):
+    return [logic._parse_date.__wrapped__(d) for d in dates] + \
+        [logic._parse_timestamp.__wrapped__(t) for t in timestamps]
+
+
+# With the caches, as the following certificates of a batch
+def cached(dates, timestamps):
+    return [logic._parse_date(d) for d in dates] + \
+        [logic._parse_timestamp(t) for t in timestamps]
+
+
+def bench(name, fun, number):
+    t = min(timeit.repeat(lambda: fun(DATES, TIMESTAMPS), number=number,
+                          repeat=5))
+    print("  {:10s} {:10.2f} us/certificate {:12.0f} ops/s".format(
+        name, t / number * 1e6, number / t
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    # Same instants and offsets
+    expected = reference(DATES, TIMESTAMPS)
+    for fun in (uncached, cached):
+        results = fun(DATES, TIMESTAMPS)
+        assert results == expected, (results, expected)
+        assert [r.utcoffset() for r in results] == \
+            [e.utcoffset() for e in expected]
+
+    print("{} dates and {} timestamps".format(len(DATES), len(TIMESTAMPS)))
+    bench("reference", reference, args.number)
+    bench("uncached", uncached, args.number)
+    bench("cached", cached, args.number)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+# Green Pass Parser
+# Copyright (C) 2021  Davide Berardi -- <berardi.dav@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Measure the import cost of the entry points with python -X importtime,
+# each one in a fresh interpreter, and list the most expensive modules.
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Entry point name and the statement which loads it
+ENTRY_POINTS = {
+    # Loaded as a module, main() is not executed
+    "cli":      "import runpy; "
+                "runpy.run_path('greenpass.py', run_name='greenpass_cli')",
+    "api":      "import greenpass.api",
+    "input":    "import greenpass.input",
+    "logic":    "import greenpass.logic",
+    "output":   "import greenpass.output",
+    "settings": "import greenpass.settings",
+    "batch":    "import greenpass.batch",
+    "daemon":   "import greenpass.daemon",
+}
+
+
+# Return {module: (self us, cumulative us)} of a fresh import of entry
+def importtime(statement):
+    p = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+    if p.returncode != 0:
+        raise RuntimeError(p.stderr.strip().splitlines()[-1])
+
+    modules = {}
+    for line in p.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            # Header line
+            continue
+        modules[fields[2].strip()] = (self_us, cumulative_us)
+    return modules
+
+
+def measure(statement, repeat):
+    best = None
+    for _ in range(repeat):
+        modules = importtime(statement)
+        total = sum(s for s, _ in modules.values())
+        if best is None or total < best[0]:
+            best = (total, modules)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("entry", nargs="*",
+                        help="entry points, default: all of {}".format(
+                            ", ".join(ENTRY_POINTS)))
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="take the best of REPEAT runs")
+    parser.add_argument("--top", type=int, default=5,
+                        help="number of modules listed per entry point")
+    parser.add_argument("--json", help="also write the results to JSON")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.entry or ENTRY_POINTS:
+        total, modules = measure(ENTRY_POINTS[name], args.repeat)
+        top = sorted(modules.items(), key=lambda m: m[1][1], reverse=True)
+        # Top level third party packages, site is loaded by the interpreter
+        top = [(m, c) for m, (_, c) in top
+               if "." not in m and m not in ("greenpass", "site")]
+        results[name] = {
+            "total_ms": total / 1000,
+            "modules": len(modules),
+            "top": {m: c / 1000 for m, c in top[:args.top]},
+        }
+
+        print("{:10s} {:8.1f} ms {:5d} modules".format(
+            name, total / 1000, len(modules)
+        ))
+        for module, cumulative in top[:args.top]:
+            print("    {:32s} {:8.1f} ms".format(module, cumulative / 1000))
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+
+# Green Pass Parser
+# Copyright (C) 2021  Davide Berardi -- <berardi.dav@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Time every stage of the verification separately and save the results
+# as JSON, to compare them between commits:
+#   tools/benchmark.py --json before.json
+#   tools/benchmark.py --json after.json --compare before.json
+# Everything runs offline: the certificate is signed again with a local
+# key, used through ForcedCertificateUpdater, and the settings are read
+# from the fixtures of tests/data/api.
+
+import os
+import sys
+import json
+import time
+import zlib
+import platform
+import argparse
+import datetime
+import tempfile
+import subprocess
+import tracemalloc
+from urllib.parse import urlparse, urlencode
+
+import cbor2
+from cose.messages import CoseMessage
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from greenpass import b45, logic as greenpass_logic, network  # noqa: E402
+from greenpass.api import ForcedCertificateUpdater  # noqa: E402
+from greenpass.input import InputTransformer  # noqa: E402
+from greenpass.logic import GreenPassParser, LogicManager  # noqa: E402
+from greenpass.settings import SettingsManager  # noqa: E402
+from greenpass.synthetic import SyntheticSigner  # noqa: E402
+
+DATA = os.path.join(ROOT, "tests", "data")
+
+
+# Answer the requests with the files of the stand-in server fixtures
+class FixtureClient(network.HTTPClient):
+    def __init__(self, root):
+        """HTTP client reading the responses from root."""
+        super(FixtureClient, self).__init__()
+        self.root = root
+
+    def get(self, url, **kwargs):
+        import requests
+
+        path = urlparse(url).path.strip("/")
+        params = kwargs.get("params", None)
+        if params:
+            path += "_" + urlencode(params).replace("&", "_")
+
+        r = requests.models.Response()
+        r.url = url
+        r.status_code = 404
+        r._content = b""
+        path = os.path.join(self.root, path)
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                r._content = f.read()
+            r.status_code = 200
+        return r
+
+
+# Sign the payload of the reference certificate again with a new key,
+# return the qrcode content and the DER certificate of the key.
+def sign_certificate(alg):
+    signer = SyntheticSigner(alg)
+    with open(os.path.join(DATA, "ah-1900.txt"), "rb") as f:
+        reference = GreenPassParser(f.read()).cose.payload
+    return signer.sign(reference), signer.certificate
+
+
+# Call fun repeatedly for about duration seconds (at least min_runs
+# times), return ops/s, latency percentiles and the peak of memory
+# allocated by a single call.
+def measure(fun, duration, min_runs):
+    fun()
+
+    samples = []
+    clock = time.perf_counter
+    start = clock()
+    while len(samples) < min_runs or clock() - start < duration:
+        t = clock()
+        fun()
+        samples.append(clock() - t)
+    samples.sort()
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    fun()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    def percentile(p):
+        return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+    return {
+        "runs": len(samples),
+        "ops_per_sec": len(samples) / sum(samples),
+        "p50_us": percentile(0.50) * 1e6,
+        "p99_us": percentile(0.99) * 1e6,
+        "peak_bytes": peak,
+    }
+
+
+# Parse the dates of a certificate without the caches, as the first
+# certificate of a batch does
+def parse_dates(dates, timestamps):
+    for fun in (greenpass_logic._parse_date,
+                greenpass_logic._parse_date_time,
+                greenpass_logic._parse_timestamp):
+        if hasattr(fun, "cache_clear"):
+            fun.cache_clear()
+    for d in dates:
+        greenpass_logic._parse_date(d)
+    for t in timestamps:
+        greenpass_logic._parse_timestamp(t)
+
+
+def get_stages(args, workdir):
+    data, der = sign_certificate(args.alg)
+    txt = os.path.join(workdir, "certificate.txt")
+    with open(txt, "wb") as f:
+        f.write(data)
+    key = os.path.join(workdir, "certificate.der")
+    with open(key, "wb") as f:
+        f.write(der)
+
+    network.set_client(FixtureClient(os.path.join(DATA, "api")))
+    sm = SettingsManager()
+    cup = ForcedCertificateUpdater(key)
+    logic = LogicManager("")
+    fast_logic = LogicManager("", fast_verify=True)
+
+    # Intermediate results, input of the following stage
+    decoded, _ = b45.decode_payload(data, data.find(b":") + 1)
+    uncompressed = zlib.decompress(decoded)
+    cose = CoseMessage.decode(uncompressed)
+    gpp = GreenPassParser(data)
+    cert = gpp.get_certificate()
+    kid, alg = cert.get_kid(), cert.get_sign_alg()
+    dates = ("2021-05-10", "2021-05-10T10:00:00+02:00", "2021-11-10T10:00:00Z")
+    timestamps = (1620640800, 1652176800)
+
+    return [
+        ("input_txt", lambda: InputTransformer(txt, "txt").get_data()),
+        ("input_png", lambda: InputTransformer(args.png, "png").get_data()),
+        ("input_pdf", None if args.pdf is None else
+            lambda: InputTransformer(args.pdf, "pdf").get_data()),
+        ("base45", lambda: b45.decode_payload(data, 4)),
+        ("zlib", lambda: zlib.decompress(decoded)),
+        ("cose_decode", lambda: CoseMessage.decode(uncompressed)),
+        ("cbor_loads", lambda: cbor2.loads(cose.payload)),
+        ("parse", lambda: GreenPassParser(data)),
+        ("parse_dates", lambda: parse_dates(dates, timestamps)),
+        ("get_certificate", gpp.get_certificate),
+        ("key_resolution", lambda: cup.get_key_coseobj(kid, alg=alg)),
+        ("verify_certificate",
+            lambda: logic.verify_certificate(cert, sm, cup)),
+        ("verify_fast",
+            lambda: fast_logic.verify_certificate(cert, sm, cup)),
+        ("end_to_end", lambda: logic.verify_data(data, sm, cup)),
+        ("end_to_end_fast", lambda: fast_logic.verify_data(data, sm, cup)),
+    ]
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            stderr=subprocess.DEVNULL, universal_newlines=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(results, previous):
+    print("\n{:20s} {:>12s} {:>12s} {:>8s}".format(
+        "stage", "before op/s", "after op/s", "change"
+    ))
+    for name, stage in results["stages"].items():
+        before = previous["stages"].get(name, {}).get("ops_per_sec", None)
+        after = stage.get("ops_per_sec", None)
+        if before is None or after is None:
+            continue
+        print("{:20s} {:12.0f} {:12.0f} {:+7.1f}%".format(
+            name, before, after, (after / before - 1) * 100
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("stage", nargs="*",
+                        help="stages to run, default: all")
+    parser.add_argument("--alg", choices=("ES256", "PS256"),
+                        default="ES256", help="signature algorithm")
+    parser.add_argument("--png", default=os.path.join(DATA, "ah-1900.png"),
+                        help="qrcode image for the png input stage")
+    parser.add_argument("--pdf", help="pdf for the pdf input stage")
+    parser.add_argument("--duration", type=float, default=1.0,
+                        help="seconds spent on each stage")
+    parser.add_argument("--min-runs", type=int, default=20,
+                        help="minimum number of calls of each stage")
+    parser.add_argument("--json", help="write the results to JSON")
+    parser.add_argument("--compare",
+                        help="compare with the results in a JSON file")
+    args = parser.parse_args()
+
+    results = {
+        "commit": get_commit(),
+        "date": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "alg": args.alg,
+        "stages": {},
+    }
+
+    with tempfile.TemporaryDirectory() as workdir:
+        stages = get_stages(args, workdir)
+        print("{:20s} {:>10s} {:>10s} {:>10s} {:>10s}".format(
+            "stage", "op/s", "p50 us", "p99 us", "peak KiB"
+        ))
+        for name, fun in stages:
+            if args.stage and name not in args.stage:
+                continue
+            if fun is None:
+                results["stages"][name] = {"skipped": "no input"}
+                print("{:20s} skipped, no input".format(name))
+                continue
+
+            # Missing optional libraries (e.g. zbar) skip the stage
+            try:
+                stage = measure(fun, args.duration, args.min_runs)
+            except (Exception, SystemExit) as e:
+                results["stages"][name] = {"skipped": repr(e)}
+                print("{:20s} skipped, {!r}".format(name, e))
+                continue
+
+            results["stages"][name] = stage
+            print("{:20s} {:10.0f} {:10.1f} {:10.1f} {:10.1f}".format(
+                name, stage["ops_per_sec"], stage["p50_us"],
+                stage["p99_us"], stage["peak_bytes"] / 1024
+            ))
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            print_comparison(results, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())